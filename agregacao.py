@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+
+from serie_temporal import SerieTemporal
+
+# Dimensões de agrupamento e o rótulo usado nos nomes dos KPIs
+DIMENSOES_KPI = {
+    "Product_Category": "Categoria",
+    "Sales_Channel": "Canal",
+    "Region_and_Sales_Rep": "Região/Representante",
+}
+# Medidas somadas por dimensão em uma única passada
+MEDIDAS_KPI = ["Sales_Amount", "Unit_Cost", "Quantity_Sold"]
+# Meses da média móvel de vendas
+JANELA_MEDIA_MOVEL = 3
+
+
+# Função para agregar várias medidas de uma dimensão em uma única passada (factorize + bincount)
+# Retorna um DataFrame indexado pelas chaves da dimensão com as colunas soma_<medida> e contagem_<medida>,
+# que podem ser somadas entre partes dos dados para obter o agregado do conjunto inteiro
+def agregar_dimensao(dados, dimensao, medidas):
+    codigos, chaves = pd.factorize(dados[dimensao], sort=True)
+    validos = codigos >= 0
+    codigos = codigos[validos]
+    n = len(chaves)
+    colunas = {}
+    for medida in medidas:
+        valores = dados[medida].to_numpy(dtype="float64", na_value=np.nan)[validos]
+        presentes = ~np.isnan(valores)
+        colunas[f"soma_{medida}"] = np.bincount(codigos, weights=np.where(presentes, valores, 0.0), minlength=n)
+        colunas[f"contagem_{medida}"] = np.bincount(codigos, weights=presentes, minlength=n)
+    return pd.DataFrame(colunas, index=pd.Index(chaves, name=dimensao))
+
+
+# Função para agregar todas as dimensões pedidas, reaproveitando a mesma lista de medidas
+def agregar_dimensoes(dados, dimensoes, medidas):
+    medidas = [m for m in medidas if m in dados.columns]
+    return {dimensao: agregar_dimensao(dados, dimensao, medidas) for dimensao in dimensoes if dimensao in dados.columns}
+
+
+# Função para montar os KPIs de vendas e lucro por dimensão a partir dos agregados
+def kpis_dimensionais(agregados):
+    kpis = {}
+    for dimensao, rotulo in DIMENSOES_KPI.items():
+        agregado = agregados.get(dimensao)
+        if agregado is None or "soma_Sales_Amount" not in agregado.columns:
+            continue
+        vendas = agregado["soma_Sales_Amount"]
+        kpis[f"Vendas por {rotulo}"] = vendas.dropna().to_dict()
+        if "soma_Unit_Cost" in agregado.columns and "soma_Quantity_Sold" in agregado.columns:
+            lucro = vendas - agregado["soma_Unit_Cost"] * agregado["soma_Quantity_Sold"]
+            kpis[f"Lucro por {rotulo}"] = lucro.dropna().to_dict()
+    return kpis
+
+
+# Função para calcular a média por grupo (ex.: ticket médio) a partir de soma e contagem
+def media_por_grupo(agregado, medida):
+    contagem = agregado[f"contagem_{medida}"]
+    return (agregado[f"soma_{medida}"] / contagem.where(contagem > 0)).dropna()
+
+
+# Função para somar dois agregados por dimensão (partes diferentes dos mesmos dados)
+def somar_agregados(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if isinstance(a.index, pd.CategoricalIndex):
+        a = a.set_axis(a.index.astype(object))
+    if isinstance(b.index, pd.CategoricalIndex):
+        b = b.set_axis(b.index.astype(object))
+    return a.add(b, fill_value=0).sort_index()
+
+
+# Função para montar os KPIs temporais (crescimento, média móvel, acumulado e tendências) a partir da série
+def kpis_temporais(serie):
+    kpis = {}
+    if "Sales_Amount" not in serie.diaria.columns:
+        return kpis
+    # Mês contra o último mês com vendas, como sempre foi calculado
+    kpis["Crescimento de Vendas Mensal (%)"] = serie.crescimento("mensal", completa=False).to_dict()
+    crescimento_anual = serie.crescimento_anual("mensal")
+    if not crescimento_anual.empty:
+        kpis["Crescimento de Vendas Anual (%)"] = crescimento_anual.to_dict()
+    media_movel = serie.media_movel(JANELA_MEDIA_MOVEL, "mensal")
+    if not media_movel.empty:
+        kpis[f"Média Móvel de Vendas ({JANELA_MEDIA_MOVEL} meses)"] = media_movel.to_dict()
+    kpis["Receita Acumulada"] = serie.acumulado("mensal").to_dict()
+    for dimensao, rotulo in DIMENSOES_KPI.items():
+        tendencias = serie.tendencias(dimensao, "mensal")
+        if not tendencias.empty:
+            kpis[f"Tendência de Vendas por {rotulo} (R$/mês)"] = tendencias.to_dict()
+    return kpis
+
+
+class ParcialKPI:
+    """Agregados parciais de um conjunto de linhas, combináveis para obter os KPIs do conjunto inteiro."""
+
+    def __init__(self):
+        self.linhas = 0
+        self.colunas = []
+        # coluna -> [soma, contagem, máximo, mínimo]
+        self.estatisticas = {}
+        self.data_min = None
+        self.data_max = None
+        self.agregados = {}
+        # Vendas por dia (e por mês em cada dimensão), base dos KPIs temporais e da série dos gráficos
+        self.serie = SerieTemporal()
+
+    @classmethod
+    def de_dados(cls, dados):
+        parcial = cls()
+        parcial.adicionar(dados)
+        return parcial
+
+    # Função para acumular um bloco de linhas (ex.: um pedaço de um arquivo lido em streaming)
+    def adicionar(self, dados):
+        outro = ParcialKPI()
+        outro.linhas = len(dados)
+        outro.colunas = dados.columns.tolist()
+        tipos = dados.dtypes.to_dict()
+
+        def eh_numerico(col): return pd.api.types.is_numeric_dtype(tipos[col]) and not pd.api.types.is_bool_dtype(tipos[col])
+
+        numericas = [coluna for coluna in outro.colunas if eh_numerico(coluna)]
+        if numericas:
+            estatisticas = dados[numericas].agg(["sum", "count", "max", "min"])
+            for coluna in numericas:
+                if estatisticas.at["count", coluna] > 0:
+                    outro.estatisticas[coluna] = [
+                        estatisticas.at["sum", coluna],
+                        int(estatisticas.at["count", coluna]),
+                        estatisticas.at["max", coluna],
+                        estatisticas.at["min", coluna],
+                    ]
+
+        datas = None
+        if "Sale_Date" in outro.colunas:
+            datas = dados["Sale_Date"]
+            if not pd.api.types.is_datetime64_any_dtype(datas):
+                datas = pd.to_datetime(datas, errors="coerce")
+            if datas.notna().any():
+                outro.data_min, outro.data_max = datas.min(), datas.max()
+
+        if "Sales_Amount" in numericas:
+            dimensoes = [d for d in list(DIMENSOES_KPI) + ["Customer_Type"] if d in outro.colunas]
+            outro.agregados = agregar_dimensoes(dados, dimensoes, [m for m in MEDIDAS_KPI if m in numericas])
+            if datas is not None:
+                outro.serie = SerieTemporal.de_dados(dados, [m for m in MEDIDAS_KPI if m in numericas], dimensoes, datas)
+
+        self.combinar(outro)
+        return self
+
+    # Função para combinar outro parcial neste (a ordem das partes não altera o resultado)
+    def combinar(self, outro):
+        self.linhas += outro.linhas
+        for coluna in outro.colunas:
+            if coluna not in self.colunas:
+                self.colunas.append(coluna)
+        for coluna, (soma, contagem, maximo, minimo) in outro.estatisticas.items():
+            atual = self.estatisticas.get(coluna)
+            if atual is None:
+                self.estatisticas[coluna] = [soma, contagem, maximo, minimo]
+            else:
+                self.estatisticas[coluna] = [atual[0] + soma, atual[1] + contagem, max(atual[2], maximo), min(atual[3], minimo)]
+        if outro.data_min is not None:
+            self.data_min = outro.data_min if self.data_min is None else min(self.data_min, outro.data_min)
+            self.data_max = outro.data_max if self.data_max is None else max(self.data_max, outro.data_max)
+        for dimensao, agregado in outro.agregados.items():
+            self.agregados[dimensao] = somar_agregados(self.agregados.get(dimensao), agregado)
+        self.serie.combinar(outro.serie)
+        return self
+
+    # Função para montar o mesmo dicionário de KPIs de calcular_kpis a partir dos agregados acumulados
+    def kpis(self):
+        kpis = {}
+        if self.linhas == 0:
+            return kpis
+
+        for coluna in self.colunas:
+            if coluna not in self.estatisticas:
+                continue
+            soma, contagem, maximo, minimo = self.estatisticas[coluna]
+            kpis[f"Total {coluna}"] = soma
+            kpis[f"Média {coluna}"] = soma / contagem
+            kpis[f"Máximo {coluna}"] = maximo
+            kpis[f"Mínimo {coluna}"] = minimo
+
+        if self.data_min is not None:
+            kpis["Período Analisado"] = f"{self.data_min.strftime('%d/%m/%Y')} a {self.data_max.strftime('%d/%m/%Y')}"
+            kpis["Dias Totais"] = (self.data_max - self.data_min).days + 1
+
+        if all(c in self.estatisticas for c in ("Sales_Amount", "Unit_Cost", "Quantity_Sold")):
+            kpis["Receita Total"] = self.estatisticas["Sales_Amount"][0]
+            kpis["Custo Total"] = self.estatisticas["Unit_Cost"][0] * self.estatisticas["Quantity_Sold"][0]
+            if kpis["Receita Total"] > 0:
+                kpis["Margem de Lucro (%)"] = ((kpis["Receita Total"] - kpis["Custo Total"]) / kpis["Receita Total"]) * 100
+
+        if "Sales_Amount" in self.estatisticas:
+            kpis.update(kpis_dimensionais({d: a for d, a in self.agregados.items() if len(a) > 0}))
+
+        if not self.serie.vazia:
+            kpis.update(kpis_temporais(self.serie))
+
+        if "Customer_Type" in self.agregados:
+            kpis["Ticket Médio por Tipo de Cliente"] = media_por_grupo(self.agregados["Customer_Type"], "Sales_Amount").to_dict()
+
+        return kpis
+
+
+# Função para calcular KPIs
+def calcular_kpis(dados):
+    if dados is None or dados.empty:
+        return {}
+
+    # Os KPIs saem dos mesmos agregados parciais usados na leitura em streaming
+    return ParcialKPI.de_dados(dados).kpis()
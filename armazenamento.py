@@ -0,0 +1,218 @@
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+
+import pandas as pd
+
+# Diretório local onde os datasets convertidos ficam salvos
+DIRETORIO_DATASETS = os.environ.get("KPI_DATASETS_DIR", "datasets")
+# Colunas de texto com poucos valores distintos, guardadas como categóricas
+COLUNAS_CATEGORICAS = ["Product_Category", "Sales_Channel", "Customer_Type", "Region_and_Sales_Rep"]
+# "arrow" (Arrow IPC sem compressão, lido via memory map) ou "parquet" (arquivo menor, leitura um pouco mais lenta)
+FORMATOS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+
+def _importar_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("O pacote pyarrow é necessário para salvar e abrir datasets. Instale com 'pip install pyarrow'.") from e
+    return pyarrow
+
+
+# Função para gerar um nome de arquivo seguro a partir do nome informado pelo usuário
+def nome_seguro(nome):
+    nome = os.path.splitext(os.path.basename(nome))[0]
+    nome = re.sub(r"[^A-Za-z0-9_.-]+", "_", nome).strip("._")
+    return nome or "dataset"
+
+
+def _caminho(nome, extensao, diretorio=None):
+    return os.path.join(diretorio or DIRETORIO_DATASETS, nome + extensao)
+
+
+# Função para obter o caminho do arquivo de dados de um dataset salvo inteiro
+def caminho_dataset(nome, formato, diretorio=None):
+    return _caminho(nome, FORMATOS[formato], diretorio)
+
+
+# Diretório com as partições de um dataset montado por anexação (ver catalogo.py)
+def diretorio_particoes(nome, diretorio=None):
+    return os.path.join(diretorio or DIRETORIO_DATASETS, nome)
+
+
+# Função para obter o caminho do arquivo de dados de uma partição
+def caminho_particao(nome, particao, formato, diretorio=None):
+    return os.path.join(diretorio_particoes(nome, diretorio), particao + FORMATOS[formato])
+
+
+# Função para converter as colunas para os tipos colunares (categóricas e datetime64)
+def preparar_tipos(dados):
+    dados = dados.copy()
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in dados.columns and not isinstance(dados[coluna].dtype, pd.CategoricalDtype):
+            dados[coluna] = dados[coluna].astype("category")
+    if "Sale_Date" in dados.columns and not pd.api.types.is_datetime64_any_dtype(dados["Sale_Date"]):
+        dados["Sale_Date"] = pd.to_datetime(dados["Sale_Date"], errors="coerce")
+    return dados
+
+
+# Função para fazer as colunas de texto seguirem a representação (categórica ou texto) de um esquema já gravado
+def _alinhar_ao_esquema(pa, dados, esquema):
+    for campo in esquema:
+        if campo.name not in dados.columns:
+            continue
+        coluna = dados[campo.name]
+        categorica = isinstance(coluna.dtype, pd.CategoricalDtype)
+        if pa.types.is_dictionary(campo.type) and not categorica and not pd.api.types.is_numeric_dtype(coluna) and not pd.api.types.is_datetime64_any_dtype(coluna):
+            dados[campo.name] = coluna.astype("category")
+        elif (pa.types.is_string(campo.type) or pa.types.is_large_string(campo.type)) and categorica:
+            dados[campo.name] = coluna.astype(object)
+    return dados
+
+
+# Função para gravar um DataFrame em formato colunar (arquivo temporário e troca atômica); retorna a tabela Arrow
+# esquema: o esquema das partições já gravadas do dataset (ver catalogo.py); uma coluna de texto categórica
+# numa partição e texto simples na outra impediria a concatenação na leitura
+def gravar_tabela(dados, caminho, formato="arrow", esquema=None):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de dataset desconhecido: {formato}. Use um de {list(FORMATOS)}.")
+    pa = _importar_pyarrow()
+    dados = preparar_tipos(dados)
+    if esquema is not None:
+        dados = _alinhar_ao_esquema(pa, dados, esquema)
+    tabela = pa.Table.from_pandas(dados, preserve_index=False)
+    temporario = caminho + ".tmp"
+    if formato == "arrow":
+        with pa.OSFile(temporario, "wb") as destino:
+            with pa.ipc.new_file(destino, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+    else:
+        pa.parquet.write_table(tabela, temporario)
+    os.replace(temporario, caminho)
+    return tabela
+
+
+# Função para gravar os metadados de um dataset (troca atômica, para a listagem nunca ler um JSON pela metade)
+def gravar_metadados(metadados, diretorio=None):
+    caminho = _caminho(metadados["nome"], ".json", diretorio)
+    with open(caminho + ".tmp", "w", encoding="utf-8") as arquivo:
+        json.dump(metadados, arquivo, ensure_ascii=False, indent=2)
+    os.replace(caminho + ".tmp", caminho)
+
+
+# Função para salvar um DataFrame já validado como dataset colunar, com metadados ao lado
+# Um dataset com o mesmo nome é substituído, inclusive as partições de um dataset montado por anexação
+def salvar_dataset(dados, nome, formato="arrow", origem=None, hash_origem=None, diretorio=None):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de dataset desconhecido: {formato}. Use um de {list(FORMATOS)}.")
+    diretorio = diretorio or DIRETORIO_DATASETS
+    os.makedirs(diretorio, exist_ok=True)
+    nome = nome_seguro(nome)
+    tabela = gravar_tabela(dados, caminho_dataset(nome, formato, diretorio), formato)
+    if os.path.isdir(diretorio_particoes(nome, diretorio)):
+        shutil.rmtree(diretorio_particoes(nome, diretorio))
+    metadados = {
+        "nome": nome,
+        "formato": formato,
+        "origem": origem,
+        "hash_origem": hash_origem,
+        "linhas": tabela.num_rows,
+        "colunas": tabela.column_names,
+        "criado_em": datetime.now().isoformat(timespec="seconds"),
+    }
+    gravar_metadados(metadados, diretorio)
+    return metadados
+
+
+# Função para ler os metadados de um dataset salvo
+def metadados_dataset(nome, diretorio=None):
+    with open(_caminho(nome_seguro(nome), ".json", diretorio), "r", encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+
+# Função para listar os datasets salvos, do mais recente para o mais antigo
+def listar_datasets(diretorio=None):
+    diretorio = diretorio or DIRETORIO_DATASETS
+    if not os.path.isdir(diretorio):
+        return []
+    datasets = []
+    for arquivo in os.listdir(diretorio):
+        if arquivo.endswith(".json"):
+            try:
+                datasets.append(metadados_dataset(arquivo[:-5], diretorio))
+            except (OSError, ValueError):
+                continue
+    return sorted(datasets, key=lambda m: m.get("criado_em", ""), reverse=True)
+
+
+def _ler_tabela(pa, caminho, formato, colunas=None):
+    if formato == "arrow":
+        with pa.memory_map(caminho, "r") as origem:
+            tabela = pa.ipc.open_file(origem).read_all()
+        if colunas is not None:
+            tabela = tabela.select([c for c in colunas if c in tabela.column_names])
+        return tabela
+    if colunas is not None:
+        esquema = pa.parquet.read_schema(caminho)
+        colunas = [c for c in colunas if c in esquema.names]
+    return pa.parquet.read_table(caminho, columns=colunas, memory_map=True)
+
+
+# Função para ler o esquema de um arquivo de dados sem ler as linhas
+def esquema_tabela(caminho, formato):
+    pa = _importar_pyarrow()
+    if formato == "arrow":
+        with pa.memory_map(caminho, "r") as origem:
+            return pa.ipc.open_file(origem).schema
+    return pa.parquet.read_schema(caminho)
+
+
+# Colunas categóricas (dictionary) numa partição e texto simples noutra (partições gravadas antes de
+# gravar_tabela seguir o esquema do dataset) são lidas como texto, o único tipo comum às duas
+def _decodificar_dicionarios_mistos(pa, tabelas):
+    tipos = {}
+    for tabela in tabelas:
+        for campo in tabela.schema:
+            tipos.setdefault(campo.name, []).append(pa.types.is_dictionary(campo.type))
+    mistas = {nome for nome, dicionarios in tipos.items() if any(dicionarios) and not all(dicionarios)}
+    for i, tabela in enumerate(tabelas):
+        for nome in mistas & set(tabela.column_names):
+            tipo = tabela.schema.field(nome).type
+            if pa.types.is_dictionary(tipo):
+                tabela = tabela.set_column(tabela.column_names.index(nome), nome, tabela.column(nome).cast(tipo.value_type))
+        tabelas[i] = tabela
+    return tabelas
+
+
+# Função para abrir um dataset salvo, lendo só as colunas pedidas (projeção) e via memory map
+# Num dataset montado por anexação, as partições são lidas e concatenadas na ordem em que foram anexadas;
+# tipos diferentes entre partições (ex.: int8 num mês e int16 no outro) são promovidos para o mais largo
+def carregar_dataset(nome, colunas=None, diretorio=None):
+    pa = _importar_pyarrow()
+    metadados = metadados_dataset(nome, diretorio)
+    if colunas is not None:
+        colunas = [c for c in colunas if c in metadados["colunas"]]
+    if metadados.get("particoes"):
+        tabelas = [_ler_tabela(pa, caminho_particao(metadados["nome"], p["id"], metadados["formato"], diretorio), metadados["formato"], colunas) for p in metadados["particoes"]]
+        tabela = pa.concat_tables(_decodificar_dicionarios_mistos(pa, tabelas), promote_options="permissive")
+        if colunas is not None:
+            tabela = tabela.select(colunas)
+        return tabela.to_pandas()
+    caminho = caminho_dataset(metadados["nome"], metadados["formato"], diretorio)
+    return _ler_tabela(pa, caminho, metadados["formato"], colunas).to_pandas()
+
+
+# Função para apagar um dataset salvo e seus metadados
+def remover_dataset(nome, diretorio=None):
+    metadados = metadados_dataset(nome, diretorio)
+    for extensao in (FORMATOS[metadados["formato"]], ".json"):
+        caminho = _caminho(metadados["nome"], extensao, diretorio)
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    if os.path.isdir(diretorio_particoes(metadados["nome"], diretorio)):
+        shutil.rmtree(diretorio_particoes(metadados["nome"], diretorio))
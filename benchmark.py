@@ -0,0 +1,196 @@
+"""Benchmark das etapas do gerador de KPIs com dados sintéticos.
+
+Uso:
+    python benchmark.py                                  # 10k, 100k e 1M linhas, entrada CSV
+    python benchmark.py --linhas 10000,100000 --entrada xlsx --saida resultado.json
+    python benchmark.py --comparar resultado_anterior.json --saida resultado.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from agregacao import calcular_kpis
+from cubo import CuboKPI
+from exportacao import exportar_csv, exportar_excel, exportar_pdf
+from graficos import criar_graficos, renderizar
+from indice import IndiceDados
+from ingestao import agregar_em_streaming, carregar_arquivo
+
+TAMANHOS_PADRAO = [10_000, 100_000, 1_000_000]
+CATEGORIAS = ["Clothing", "Electronics", "Food", "Furniture", "Toys", "Books", "Sports", "Beauty"]
+CANAIS = ["Online", "Retail", "Distributor", "Marketplace"]
+REGIOES = ["North", "South", "East", "West", "Central"]
+
+
+# Função para gerar vendas sintéticas com as 13 colunas esperadas pelo app
+def gerar_vendas_sinteticas(linhas, categorias=4, canais=3, representantes=40, dias=730, produtos=1000, semente=0):
+    rng = np.random.default_rng(semente)
+    regioes = rng.choice(REGIOES, representantes)
+    reps = rng.integers(0, representantes, linhas)
+    quantidade = rng.integers(1, 50, linhas)
+    custo = rng.uniform(5, 3000, linhas).round(2)
+    preco = (custo * rng.uniform(1.05, 1.8, linhas)).round(2)
+    desconto = rng.choice([0.0, 0.05, 0.1, 0.15, 0.2], linhas)
+    return pd.DataFrame({
+        "Product_ID": rng.integers(1000, 1000 + produtos, linhas),
+        "Sale_Date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, dias, linhas), unit="D"),
+        "Sales_Rep_Region": regioes[reps],
+        "Sales_Amount": (preco * quantidade * (1 - desconto)).round(2),
+        "Quantity_Sold": quantidade,
+        "Product_Category": rng.choice(CATEGORIAS[:categorias], linhas),
+        "Unit_Cost": custo,
+        "Unit_Price": preco,
+        "Customer_Type": rng.choice(["New", "Returning"], linhas),
+        "Discount": desconto,
+        "Payment_Method": rng.choice(["Cash", "Credit Card", "Bank Transfer"], linhas),
+        "Sales_Channel": rng.choice(CANAIS[:canais], linhas),
+        "Region_and_Sales_Rep": [f"{regioes[r]}-Rep{r}" for r in reps],
+    })
+
+
+# Função para serializar os dados no formato de entrada (fora da medição)
+def gerar_arquivo(dados, formato):
+    buffer = BytesIO()
+    if formato == "csv":
+        dados.to_csv(buffer, index=False)
+    else:
+        dados.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+# Função para medir tempo e pico de memória (tracemalloc) de uma etapa
+def medir(funcao, medir_memoria=True):
+    if medir_memoria:
+        tracemalloc.reset_peak()
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+    inicio = time.perf_counter()
+    retorno = funcao()
+    segundos = time.perf_counter() - inicio
+    pico_mb = None
+    if medir_memoria:
+        pico_mb = (tracemalloc.get_traced_memory()[1] - memoria_inicial) / (1024 * 1024)
+    return retorno, segundos, pico_mb
+
+
+# Função para executar todas as etapas para um tamanho de dados
+def executar_etapas(linhas, formato, repeticoes_consulta=20, medir_memoria=True, **opcoes_geracao):
+    dados_sinteticos = gerar_vendas_sinteticas(linhas, **opcoes_geracao)
+    conteudo = gerar_arquivo(dados_sinteticos, formato)
+    del dados_sinteticos
+    nome = f"sinteticos.{formato}"
+    resultados = []
+
+    # Nas consultas repetidas, o tempo registrado é o total das repetições
+    def registrar(etapa, funcao, repeticoes=1):
+        retorno, segundos, pico_mb = medir(funcao, medir_memoria)
+        resultados.append({
+            "linhas": linhas,
+            "etapa": etapa,
+            "repeticoes": repeticoes,
+            "segundos": round(segundos, 6),
+            "pico_memoria_mb": None if pico_mb is None else round(pico_mb, 3),
+            "linhas_por_segundo": round(linhas * repeticoes / segundos) if segundos > 0 else None,
+        })
+        return retorno
+
+    dados, _ = registrar("ingestao", lambda: carregar_arquivo(BytesIO(conteudo), nome))
+    registrar("ingestao_streaming", lambda: agregar_em_streaming(BytesIO(conteudo), nome))
+    kpis = registrar("kpis", lambda: calcular_kpis(dados))
+
+    datas = dados["Sale_Date"]
+    inicio_filtro = (datas.min() + (datas.max() - datas.min()) / 4).date()
+    fim_filtro = (datas.max() - (datas.max() - datas.min()) / 4).date()
+    categoria = dados["Product_Category"].iloc[0]
+    cubo = registrar("filtro_cubo_montagem", lambda: CuboKPI(dados))
+    registrar("filtro_cubo_consulta", lambda: [cubo.kpis(inicio_filtro, fim_filtro, categoria, "Todos") for _ in range(repeticoes_consulta)], repeticoes_consulta)
+    indice = IndiceDados(dados)
+    registrar("filtro_linhas", lambda: [indice.filtrar(inicio_filtro, fim_filtro, categoria, "Todos") for _ in range(repeticoes_consulta)], repeticoes_consulta)
+
+    registrar("graficos", lambda: renderizar(criar_graficos(dados)))
+    registrar("exportacao_pdf", lambda: exportar_pdf(kpis))
+    registrar("exportacao_excel", lambda: exportar_excel(kpis))
+    registrar("exportacao_csv", lambda: exportar_csv(kpis))
+    return resultados
+
+
+# Função para comparar com uma execução anterior; retorna as linhas de relatório e se houve regressão
+def comparar(resultados, anteriores, tolerancia):
+    base = {(r["linhas"], r["etapa"]): r for r in anteriores}
+    relatorio = []
+    regressao = False
+    for r in resultados:
+        anterior = base.get((r["linhas"], r["etapa"]))
+        if anterior is None or not anterior["segundos"]:
+            continue
+        razao = r["segundos"] / anterior["segundos"]
+        marca = ""
+        if razao > 1 + tolerancia:
+            marca = "  <-- regressão"
+            regressao = True
+        relatorio.append(f"{r['linhas']:>10} {r['etapa']:<22} {anterior['segundos']:>10.4f}s -> {r['segundos']:>10.4f}s  ({razao:.2f}x){marca}")
+    return relatorio, regressao
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede tempo e memória das etapas de ingestão, KPIs, filtros, gráficos e exportação.")
+    parser.add_argument("--linhas", default=",".join(str(n) for n in TAMANHOS_PADRAO), help="Tamanhos separados por vírgula (padrão: 10000,100000,1000000)")
+    parser.add_argument("--entrada", choices=["csv", "xlsx"], default="csv", help="Formato do arquivo sintético lido na ingestão")
+    parser.add_argument("--categorias", type=int, default=4, help="Quantidade de categorias de produto")
+    parser.add_argument("--canais", type=int, default=3, help="Quantidade de canais de venda")
+    parser.add_argument("--representantes", type=int, default=40, help="Quantidade de representantes (Region_and_Sales_Rep)")
+    parser.add_argument("--dias", type=int, default=730, help="Quantidade de dias cobertos pelas vendas")
+    parser.add_argument("--semente", type=int, default=0, help="Semente do gerador aleatório")
+    parser.add_argument("--sem-memoria", action="store_true", help="Não mede memória (o tracemalloc deixa as etapas mais lentas)")
+    parser.add_argument("--saida", help="Arquivo JSON com os resultados")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Aumento relativo de tempo considerado regressão (padrão: 0.2)")
+    args = parser.parse_args(argv)
+
+    tamanhos = [int(n) for n in args.linhas.split(",") if n.strip()]
+    opcoes_geracao = {"categorias": args.categorias, "canais": args.canais, "representantes": args.representantes, "dias": args.dias, "semente": args.semente}
+    if not args.sem_memoria:
+        tracemalloc.start()
+
+    resultados = []
+    for linhas in tamanhos:
+        for r in executar_etapas(linhas, args.entrada, medir_memoria=not args.sem_memoria, **opcoes_geracao):
+            resultados.append(r)
+            memoria = "" if r["pico_memoria_mb"] is None else f"  pico {r['pico_memoria_mb']:.1f} MB"
+            print(f"{linhas:>10} {r['etapa']:<22} {r['segundos']:>10.4f}s{memoria}")
+
+    saida = {
+        "metadados": {
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "plataforma": platform.platform(),
+            "entrada": args.entrada,
+            **opcoes_geracao,
+        },
+        "resultados": resultados,
+    }
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(saida, arquivo, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as arquivo:
+            anteriores = json.load(arquivo)["resultados"]
+        relatorio, regressao = comparar(resultados, anteriores, args.tolerancia)
+        print("\nComparação com", args.comparar)
+        print("\n".join(relatorio))
+        return 1 if regressao else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
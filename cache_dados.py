@@ -0,0 +1,343 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# Limite padrão de memória do cache compartilhado (em MB), configurável por variável de ambiente
+LIMITE_CACHE_MB = int(os.environ.get("KPI_CACHE_LIMITE_MB", "512"))
+# Limite do cache por sessão (em MB); cada usuário conectado tem o seu
+LIMITE_CACHE_SESSAO_MB = int(os.environ.get("KPI_CACHE_SESSAO_LIMITE_MB", "256"))
+# Escopo usado pelo app: "compartilhado" (entre sessões do mesmo processo) ou "sessao"
+ESCOPO_CACHE = os.environ.get("KPI_CACHE_ESCOPO", "compartilhado")
+# Tempo de vida (em segundos) das entradas do cache compartilhado; 0 = sem expiração
+TTL_CACHE_SEGUNDOS = int(os.environ.get("KPI_CACHE_TTL_SEGUNDOS", "0"))
+# Diretório da cópia em disco do cache compartilhado (datasets e KPIs); sem a variável, o cache fica só na memória
+DIRETORIO_CACHE = os.environ.get("KPI_CACHE_DIRETORIO")
+LIMITE_CACHE_DISCO_MB = int(os.environ.get("KPI_CACHE_DISCO_LIMITE_MB", "2048"))
+
+
+# Função para gerar a chave do cache a partir do conteúdo do arquivo enviado
+def hash_conteudo(conteudo):
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+# Função para estimar a memória ocupada por um valor guardado no cache
+def tamanho_em_bytes(valor):
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        uso = valor.memory_usage(deep=True)
+        return int(uso.sum()) if isinstance(uso, pd.Series) else int(uso)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(v) for v in valor)
+    # Objetos que guardam referências a dados já contados informam o próprio tamanho
+    if hasattr(valor, "tamanho_em_bytes"):
+        return valor.tamanho_em_bytes()
+    # Objetos próprios (ex.: CuboKPI) são medidos pelos seus atributos
+    if hasattr(valor, "__dict__") and not isinstance(valor, type):
+        return sys.getsizeof(valor) + tamanho_em_bytes(vars(valor))
+    return sys.getsizeof(valor)
+
+
+# Função para obter o dataset de origem de uma chave do cache
+# As chaves do app são o hash do arquivo ou tuplas (dataset de origem, tipo do valor, parâmetros...)
+def dataset_da_chave(chave):
+    return chave[0] if isinstance(chave, tuple) and chave else chave
+
+
+class CacheDisco:
+    """Cópia em disco das entradas do cache, limitada pelo tamanho total dos arquivos."""
+
+    def __init__(self, diretorio, limite_bytes, ttl_segundos=None):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self.ttl_segundos = ttl_segundos or None
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.despejos = 0
+        os.makedirs(diretorio, exist_ok=True)
+
+    # Só datasets e dicionários de KPIs vão para o disco; objetos que apontam para os dados (cubo, índice)
+    # duplicariam o DataFrame no arquivo e são remontados a partir dele
+    @staticmethod
+    def aceita(valor):
+        return isinstance(valor, (pd.DataFrame, dict))
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, hashlib.sha256(repr(chave).encode("utf-8")).hexdigest() + ".pkl")
+
+    # Os arquivos são gravados apenas por este app, no diretório configurado por quem administra o servidor
+    def obter(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "rb") as arquivo:
+                expira_em, valor = pickle.load(arquivo)
+        except FileNotFoundError:
+            self.falhas += 1
+            return None
+        except Exception:
+            # Arquivo corrompido ou de uma versão incompatível do pandas: descartado
+            self._apagar(caminho)
+            self.falhas += 1
+            return None
+        if expira_em is not None and time.time() > expira_em:
+            self._apagar(caminho)
+            self.falhas += 1
+            return None
+        # A data de modificação marca o último acesso, usada para despejar os arquivos menos usados
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+        self.acertos += 1
+        return valor
+
+    def guardar(self, chave, valor):
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        expira_em = time.time() + self.ttl_segundos if self.ttl_segundos else None
+        try:
+            with open(temporario, "wb") as arquivo:
+                pickle.dump((expira_em, valor), arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, caminho)
+        except Exception:
+            self._apagar(temporario)
+            return False
+        self._despejar()
+        return True
+
+    def remover(self, chave):
+        self._apagar(self._caminho(chave))
+
+    def limpar(self):
+        for caminho, _, _ in self._arquivos():
+            self._apagar(caminho)
+
+    def _arquivos(self):
+        arquivos = []
+        with os.scandir(self.diretorio) as entradas:
+            for entrada in entradas:
+                if entrada.name.endswith(".pkl"):
+                    try:
+                        info = entrada.stat()
+                    except OSError:
+                        continue
+                    arquivos.append((entrada.path, info.st_size, info.st_mtime))
+        return arquivos
+
+    def _despejar(self):
+        with self._lock:
+            arquivos = sorted(self._arquivos(), key=lambda a: a[2])
+            uso = sum(tamanho for _, tamanho, _ in arquivos)
+            for caminho, tamanho, _ in arquivos:
+                if uso <= self.limite_bytes:
+                    break
+                self._apagar(caminho)
+                uso -= tamanho
+                self.despejos += 1
+
+    @staticmethod
+    def _apagar(caminho):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+    def estatisticas(self):
+        arquivos = self._arquivos()
+        return {
+            "itens": len(arquivos),
+            "uso_bytes": sum(tamanho for _, tamanho, _ in arquivos),
+            "limite_bytes": self.limite_bytes,
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "despejos": self.despejos,
+        }
+
+
+class CacheLRU:
+    """Cache LRU limitado pela memória estimada dos valores guardados, com validade e cópia em disco opcionais."""
+
+    def __init__(self, limite_bytes, ttl_segundos=None, disco=None):
+        self.limite_bytes = limite_bytes
+        self.ttl_segundos = ttl_segundos or None
+        self.disco = disco
+        self._itens = OrderedDict()
+        self._tamanhos = {}
+        self._expira_em = {}
+        # dataset de origem -> usuários que já provaram ter acesso a ele (ver CacheUsuario)
+        self._acessos = {}
+        self._lock = threading.Lock()
+        self.uso_bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.despejos = 0
+        self.expirados = 0
+
+    def obter(self, chave):
+        with self._lock:
+            if chave in self._itens and self._expirou(chave):
+                self._remover(chave)
+                self.expirados += 1
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+        if self.disco is None:
+            return None
+        # Falha na memória: tenta a cópia em disco e traz o valor de volta para a memória
+        valor = self.disco.obter(chave)
+        if valor is not None:
+            self._guardar_na_memoria(chave, valor)
+        return valor
+
+    # Devolve False se o valor não ficou guardado (maior que o limite inteiro e fora do disco)
+    def guardar(self, chave, valor):
+        guardado = self._guardar_na_memoria(chave, valor)
+        if self.disco is not None and self.disco.aceita(valor):
+            guardado = self.disco.guardar(chave, valor) or guardado
+        return guardado
+
+    def _guardar_na_memoria(self, chave, valor):
+        tamanho = tamanho_em_bytes(valor)
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+            # Um valor maior que o limite inteiro não é guardado
+            if tamanho > self.limite_bytes:
+                return False
+            self._itens[chave] = valor
+            self._tamanhos[chave] = tamanho
+            if self.ttl_segundos:
+                self._expira_em[chave] = time.monotonic() + self.ttl_segundos
+            self.uso_bytes += tamanho
+            while self.uso_bytes > self.limite_bytes and self._itens:
+                mais_antiga = next(iter(self._itens))
+                self._remover(mais_antiga)
+                self.despejos += 1
+        return True
+
+    def remover(self, chave):
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+        if self.disco is not None:
+            self.disco.remover(chave)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._tamanhos.clear()
+            self._expira_em.clear()
+            self.uso_bytes = 0
+        if self.disco is not None:
+            self.disco.limpar()
+
+    # Função para descartar de uma vez as entradas vencidas (as demais vencem ao serem lidas)
+    def limpar_expirados(self):
+        with self._lock:
+            vencidas = [chave for chave in self._expira_em if self._expirou(chave)]
+            for chave in vencidas:
+                self._remover(chave)
+            self.expirados += len(vencidas)
+        return len(vencidas)
+
+    # Função para registrar que o usuário tem acesso a um dataset (ex.: ele mesmo enviou o arquivo)
+    def liberar(self, dataset, usuario):
+        with self._lock:
+            self._acessos.setdefault(dataset, set()).add(usuario)
+
+    def tem_acesso(self, dataset, usuario):
+        with self._lock:
+            return usuario in self._acessos.get(dataset, ())
+
+    def estatisticas(self):
+        with self._lock:
+            estatisticas = {
+                "itens": len(self._itens),
+                "uso_bytes": self.uso_bytes,
+                "limite_bytes": self.limite_bytes,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "despejos": self.despejos,
+                "expirados": self.expirados,
+                "ttl_segundos": self.ttl_segundos,
+                "datasets_com_acesso": len(self._acessos),
+            }
+        if self.disco is not None:
+            estatisticas["disco"] = self.disco.estatisticas()
+        return estatisticas
+
+    def __contains__(self, chave):
+        with self._lock:
+            return chave in self._itens
+
+    def __len__(self):
+        return len(self._itens)
+
+    def _expirou(self, chave):
+        expira_em = self._expira_em.get(chave)
+        return expira_em is not None and time.monotonic() > expira_em
+
+    def _remover(self, chave):
+        del self._itens[chave]
+        self._expira_em.pop(chave, None)
+        self.uso_bytes -= self._tamanhos.pop(chave)
+
+
+class CacheUsuario:
+    """Visão de um usuário sobre o cache: só enxerga as entradas dos datasets liberados para ele.
+
+    O resultado de um arquivo é reaproveitado entre usuários, mas só por quem enviou o mesmo conteúdo
+    (o hash do arquivo é a prova de acesso) ou abriu o mesmo dataset salvo."""
+
+    def __init__(self, cache, usuario):
+        self.cache = cache
+        self.usuario = usuario
+
+    def liberar(self, dataset):
+        self.cache.liberar(dataset, self.usuario)
+
+    def obter(self, chave):
+        if not self.cache.tem_acesso(dataset_da_chave(chave), self.usuario):
+            return None
+        return self.cache.obter(chave)
+
+    def guardar(self, chave, valor):
+        self.liberar(dataset_da_chave(chave))
+        return self.cache.guardar(chave, valor)
+
+    def remover(self, chave):
+        if self.cache.tem_acesso(dataset_da_chave(chave), self.usuario):
+            self.cache.remover(chave)
+
+    def estatisticas(self):
+        return self.cache.estatisticas()
+
+
+# Cache compartilhado entre todas as sessões do processo (o módulo é importado uma única vez pelo Streamlit)
+CACHE_COMPARTILHADO = CacheLRU(
+    LIMITE_CACHE_MB * 1024 * 1024,
+    ttl_segundos=TTL_CACHE_SEGUNDOS,
+    disco=CacheDisco(DIRETORIO_CACHE, LIMITE_CACHE_DISCO_MB * 1024 * 1024, TTL_CACHE_SEGUNDOS) if DIRETORIO_CACHE else None,
+)
+
+
+# Função para obter o cache do escopo configurado; a sessão guarda o seu próprio CacheLRU em session_state
+# Com usuario, o cache devolvido só dá acesso aos datasets liberados para esse usuário
+def cache_do_escopo(estado_sessao, escopo=None, usuario=None):
+    escopo = escopo or ESCOPO_CACHE
+    if escopo == "sessao":
+        if "cache_dados" not in estado_sessao:
+            estado_sessao["cache_dados"] = CacheLRU(LIMITE_CACHE_SESSAO_MB * 1024 * 1024)
+        cache = estado_sessao["cache_dados"]
+    else:
+        cache = CACHE_COMPARTILHADO
+    return cache if usuario is None else CacheUsuario(cache, usuario)
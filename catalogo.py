@@ -0,0 +1,179 @@
+import os
+import pickle
+import threading
+from datetime import datetime
+
+from agregacao import ParcialKPI
+from armazenamento import (
+    DIRETORIO_DATASETS, FORMATOS, caminho_dataset, caminho_particao, carregar_dataset, diretorio_particoes,
+    esquema_tabela, gravar_metadados, gravar_tabela, metadados_dataset, nome_seguro,
+)
+
+# Arquivo com a combinação dos agregados parciais de todas as partições do dataset
+ARQUIVO_CONSOLIDADO = "consolidado.pkl"
+
+# Uma trava por dataset: duas sessões anexando ao mesmo dataset escolheriam o mesmo número de partição
+_lock = threading.Lock()
+_travas = {}
+
+
+class ErroCatalogo(ValueError):
+    pass
+
+
+def _trava_dataset(nome, diretorio):
+    with _lock:
+        return _travas.setdefault((os.path.abspath(diretorio), nome), threading.Lock())
+
+
+def _caminho_parcial(nome, particao, diretorio=None):
+    return os.path.join(diretorio_particoes(nome, diretorio), particao + ".parcial.pkl")
+
+
+def _caminho_consolidado(nome, diretorio=None):
+    return os.path.join(diretorio_particoes(nome, diretorio), ARQUIVO_CONSOLIDADO)
+
+
+# Os agregados parciais são gravados pelo próprio app, no diretório dos datasets (como o cache em disco)
+def _gravar_parcial(parcial, caminho):
+    with open(caminho + ".tmp", "wb") as arquivo:
+        pickle.dump(parcial, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(caminho + ".tmp", caminho)
+
+
+def _ler_parcial(caminho):
+    with open(caminho, "rb") as arquivo:
+        return pickle.load(arquivo)
+
+
+def _descrever_periodo(particao):
+    if particao.get("data_min") is None:
+        return "sem datas"
+    return f"{datetime.fromisoformat(particao['data_min']).strftime('%d/%m/%Y')} a {datetime.fromisoformat(particao['data_max']).strftime('%d/%m/%Y')}"
+
+
+def _sobrepoe(particao, data_min, data_max):
+    if data_min is None or particao.get("data_min") is None:
+        return False
+    return particao["data_min"] <= data_max.isoformat() and data_min.isoformat() <= particao["data_max"]
+
+
+def _dados_particao(parcial, particao, origem, hash_origem, linhas):
+    return {
+        "id": particao,
+        "origem": origem,
+        "hash_origem": hash_origem,
+        "linhas": linhas,
+        "data_min": None if parcial.data_min is None else parcial.data_min.isoformat(),
+        "data_max": None if parcial.data_max is None else parcial.data_max.isoformat(),
+        "anexada_em": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+# Função para transformar um dataset salvo inteiro (salvar_dataset) na primeira partição de um dataset anexável
+# O arquivo é movido para o diretório das partições e seus agregados parciais são calculados uma única vez
+def _particionar(metadados, diretorio):
+    nome, formato = metadados["nome"], metadados["formato"]
+    os.makedirs(diretorio_particoes(nome, diretorio), exist_ok=True)
+    parcial = ParcialKPI.de_dados(carregar_dataset(nome, diretorio=diretorio))
+    os.replace(caminho_dataset(nome, formato, diretorio), caminho_particao(nome, "p0001", formato, diretorio))
+    _gravar_parcial(parcial, _caminho_parcial(nome, "p0001", diretorio))
+    _gravar_parcial(parcial, _caminho_consolidado(nome, diretorio))
+    metadados = dict(metadados, particoes=[_dados_particao(parcial, "p0001", metadados.get("origem"), metadados.get("hash_origem"), metadados["linhas"])])
+    gravar_metadados(metadados, diretorio)
+    return metadados
+
+
+# Função para anexar uma planilha já validada (ex.: o mês novo) a um dataset salvo, criando-o se não existir
+# Só a partição nova é gravada e agregada: os agregados das partições anteriores ficam guardados e o
+# consolidado é atualizado combinando o parcial novo, sem reler o histórico.
+# Um período que já está no dataset só é aceito com substituir=True (ex.: o mês reenviado com correções);
+# as partições sobrepostas são removidas e o consolidado é refeito a partir dos parciais guardados.
+def anexar_ao_dataset(dados, nome, formato="arrow", origem=None, hash_origem=None, substituir=False, diretorio=None):
+    diretorio = diretorio or DIRETORIO_DATASETS
+    nome = nome_seguro(nome)
+    with _trava_dataset(nome, diretorio):
+        return _anexar(dados, nome, formato, origem, hash_origem, substituir, diretorio)
+
+
+def _anexar(dados, nome, formato, origem, hash_origem, substituir, diretorio):
+    try:
+        metadados = metadados_dataset(nome, diretorio)
+    except FileNotFoundError:
+        metadados = None
+    if metadados is not None and not metadados.get("particoes"):
+        metadados = _particionar(metadados, diretorio)
+    particoes = metadados["particoes"] if metadados is not None else []
+    formato = metadados["formato"] if metadados is not None else formato
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de dataset desconhecido: {formato}. Use um de {list(FORMATOS)}.")
+
+    if hash_origem is not None:
+        repetida = next((p for p in particoes if p.get("hash_origem") == hash_origem), None)
+        if repetida is not None:
+            raise ErroCatalogo(f"Este arquivo já foi anexado ao dataset '{nome}' (partição {repetida['id']}, {_descrever_periodo(repetida)}).")
+
+    parcial = ParcialKPI.de_dados(dados)
+    sobrepostas = [p for p in particoes if _sobrepoe(p, parcial.data_min, parcial.data_max)]
+    if sobrepostas and not substituir:
+        periodos = "; ".join(f"{p['id']}: {_descrever_periodo(p)}" for p in sobrepostas)
+        raise ErroCatalogo(f"O período do arquivo já está no dataset '{nome}' ({periodos}). Anexe com substituição para trocar essas partições.")
+
+    os.makedirs(diretorio_particoes(nome, diretorio), exist_ok=True)
+    particao = "p{:04d}".format(max((int(p["id"][1:]) for p in particoes), default=0) + 1)
+    # A partição nova segue o esquema das anteriores (ex.: uma coluna de texto categórica no histórico)
+    esquema = esquema_tabela(caminho_particao(nome, particoes[-1]["id"], formato, diretorio), formato) if particoes else None
+    tabela = gravar_tabela(dados, caminho_particao(nome, particao, formato, diretorio), formato, esquema)
+    _gravar_parcial(parcial, _caminho_parcial(nome, particao, diretorio))
+
+    mantidas = [p for p in particoes if p not in sobrepostas]
+    if sobrepostas:
+        consolidado = ParcialKPI()
+        for p in mantidas:
+            consolidado.combinar(_ler_parcial(_caminho_parcial(nome, p["id"], diretorio)))
+    else:
+        consolidado = parcial_dataset(nome, diretorio) if particoes else ParcialKPI()
+    consolidado.combinar(parcial)
+    _gravar_parcial(consolidado, _caminho_consolidado(nome, diretorio))
+
+    colunas = list(metadados["colunas"]) if metadados is not None else []
+    colunas += [c for c in tabela.column_names if c not in colunas]
+    particoes = mantidas + [_dados_particao(parcial, particao, origem, hash_origem, tabela.num_rows)]
+    metadados = {
+        "nome": nome,
+        "formato": formato,
+        "origem": origem,
+        "hash_origem": hash_origem,
+        "linhas": sum(p["linhas"] for p in particoes),
+        "colunas": colunas,
+        # criado_em muda a cada anexação: o app usa nome + criado_em na chave do cache
+        "criado_em": datetime.now().isoformat(timespec="seconds"),
+        "particoes": particoes,
+    }
+    gravar_metadados(metadados, diretorio)
+
+    # Os arquivos substituídos só são apagados depois que os metadados novos já não os citam
+    for p in sobrepostas:
+        for caminho in (caminho_particao(nome, p["id"], formato, diretorio), _caminho_parcial(nome, p["id"], diretorio)):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+    return metadados
+
+
+# Função para obter os agregados parciais do histórico inteiro de um dataset, sem ler as linhas
+# Num dataset salvo inteiro (sem partições), retorna None
+def parcial_dataset(nome, diretorio=None):
+    caminho = _caminho_consolidado(nome_seguro(nome), diretorio)
+    if not os.path.exists(caminho):
+        return None
+    return _ler_parcial(caminho)
+
+
+# Função para calcular os KPIs do histórico inteiro de um dataset (mesmo resultado de calcular_kpis sobre todas
+# as partições juntas) a partir dos agregados guardados
+def kpis_dataset(nome, diretorio=None):
+    parcial = parcial_dataset(nome, diretorio)
+    if parcial is None:
+        parcial = ParcialKPI.de_dados(carregar_dataset(nome, diretorio=diretorio))
+    return parcial.kpis()
+
@@ -0,0 +1,320 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from agregacao import MEDIDAS_KPI
+
+# Medidas que podem ser pedidas no chat: nome -> (rótulo, palavras que a identificam)
+MEDIDAS_CONSULTA = {
+    "vendas": ("Vendas", ("vendas", "venda", "receita", "faturamento")),
+    "lucro": ("Lucro", ("lucros", "lucro")),
+    "quantidade": ("Quantidade Vendida", ("quantidade", "unidades", "itens")),
+    "ticket_medio": ("Ticket Médio", ("ticket medio", "ticket")),
+}
+# Dimensões que podem ser pedidas no chat: coluna -> (rótulo, palavras que a identificam)
+DIMENSOES_CONSULTA = {
+    "Product_Category": ("Categoria", ("categorias", "categoria")),
+    "Sales_Channel": ("Canal", ("canais", "canal")),
+    "Region_and_Sales_Rep": ("Região/Representante", ("regioes", "regiao", "representantes", "representante")),
+    "Customer_Type": ("Tipo de Cliente", ("tipos de cliente", "tipo de cliente", "clientes", "cliente")),
+    "Payment_Method": ("Método de Pagamento", ("metodos de pagamento", "metodo de pagamento", "formas de pagamento", "forma de pagamento", "pagamento")),
+}
+MESES = {
+    "janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6,
+    "julho": 7, "agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12,
+}
+# Resultados de consultas guardados por dataset
+MAX_RESULTADOS_CONSULTA = 256
+# Dimensões com mais valores distintos que isto (ex.: Região/Representante com milhares de representantes) ficam
+# fora da tabela com todas as dimensões, que cresceria com o produto dos valores; as consultas que as combinam
+# com outra dimensão usam uma tabela montada na primeira vez que a combinação é pedida
+LIMITE_VALORES_TABELA = int(os.environ.get("KPI_CONSULTAS_LIMITE_VALORES", "50"))
+
+_MES = "(" + "|".join(MESES) + ")"
+_ANO = r"((?:19|20)\d{2})"
+PADROES_PERIODO = [
+    ("intervalo_meses", re.compile(rf"\b(?:de|entre)\s+{_MES}(?:\s+(?:de\s+)?{_ANO})?\s+(?:a|ate|e)\s+{_MES}(?:\s+(?:de\s+)?{_ANO})?")),
+    ("intervalo_anos", re.compile(rf"\b{_ANO}\s+(?:a|ate|e)\s+{_ANO}\b")),
+    ("trimestre", re.compile(rf"\b([1-4])\s*(?:o|º|°)?\s+trimestre(?:\s+(?:de\s+)?{_ANO})?")),
+    ("ultimos_meses", re.compile(r"\bultim[oa]s\s+(\d+)\s+meses\b")),
+    ("ultimo_mes", re.compile(r"\bultimo\s+mes\b")),
+    ("ultimo_trimestre", re.compile(r"\bultimo\s+trimestre\b")),
+    ("ultimo_ano", re.compile(r"\bultimo\s+ano\b")),
+    ("mes", re.compile(rf"\b{_MES}(?:\s+(?:de\s+)?{_ANO})?")),
+    ("mes_numerico", re.compile(rf"\b(\d{{1,2}})/{_ANO}\b")),
+    ("ano", re.compile(rf"\b{_ANO}\b")),
+]
+AJUDA_CONSULTA = (
+    "Desculpe, não entendi. Peça uma medida (vendas, lucro, quantidade ou ticket médio), "
+    "opcionalmente por uma dimensão (categoria, canal, região, tipo de cliente ou método de pagamento), "
+    "valores para filtrar e um período em meses. Ex.: 'lucro por categoria no canal Online em 2023', "
+    "'ticket médio por método de pagamento de janeiro a março de 2024', 'quantidade por região nos últimos 6 meses'."
+)
+
+
+class ErroConsulta(ValueError):
+    pass
+
+
+# Função para normalizar o texto do pedido e os valores das dimensões (minúsculas e sem acentos)
+def normalizar(texto):
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    return " ".join("".join(c for c in texto if not unicodedata.combining(c)).split())
+
+
+def _primeira_ocorrencia(texto, palavras):
+    posicoes = [m.start() for palavra in palavras for m in [re.search(rf"\b{re.escape(palavra)}\b", texto)] if m]
+    return min(posicoes) if posicoes else None
+
+
+class Consulta:
+    """Pedido estruturado: medida, dimensão de agrupamento, filtros por valor e período (meses, inclusive)."""
+
+    def __init__(self, medida, dimensao=None, filtros=None, periodo=None):
+        self.medida = medida
+        self.dimensao = dimensao
+        # coluna -> valores aceitos
+        self.filtros = {coluna: tuple(valores) for coluna, valores in (filtros or {}).items()}
+        # (pd.Period inicial, pd.Period final) ou None para todo o histórico
+        self.periodo = periodo
+
+    # Chave usada para guardar o resultado (consultas iguais, escritas de formas diferentes, têm a mesma chave)
+    def chave(self):
+        filtros = tuple(sorted((coluna, tuple(sorted(map(str, valores)))) for coluna, valores in self.filtros.items()))
+        periodo = None if self.periodo is None else tuple(str(p) for p in self.periodo)
+        return (self.medida, self.dimensao, filtros, periodo)
+
+    def titulo(self):
+        titulo = MEDIDAS_CONSULTA[self.medida][0]
+        if self.dimensao is not None:
+            titulo += f" por {DIMENSOES_CONSULTA[self.dimensao][0]}"
+        detalhes = [f"{DIMENSOES_CONSULTA[coluna][0]}: {', '.join(map(str, valores))}" for coluna, valores in self.filtros.items()]
+        if self.periodo is not None:
+            inicio, fim = self.periodo
+            detalhes.append(inicio.strftime("%m/%Y") if inicio == fim else f"{inicio.strftime('%m/%Y')} a {fim.strftime('%m/%Y')}")
+        return f"{titulo} ({'; '.join(detalhes)})" if detalhes else titulo
+
+
+class MotorConsultas:
+    """Responde às consultas do chat a partir de agregados por (mês, dimensões), montados uma vez por dataset.
+
+    Cada consulta usa a menor tabela que tem as colunas de que precisa e o resultado fica guardado."""
+
+    def __init__(self, dados):
+        # O DataFrame referenciado já é contado no cache dos dados (como no IndiceDados)
+        self.dados = dados
+        self.dimensoes = [d for d in DIMENSOES_CONSULTA if d in dados.columns]
+        self.medidas = [m for m in MEDIDAS_KPI if m in dados.columns]
+        self.tem_datas = "Sale_Date" in dados.columns
+        self.combinadas = [d for d in self.dimensoes if dados[d].nunique() <= LIMITE_VALORES_TABELA]
+
+        # Somas das medidas por (mês, dimensões de poucos valores) e, para as consultas com uma só dimensão,
+        # o agregado de cada dimensão (e o total por mês): das dimensões da tabela, tirado dela; das demais,
+        # numa passada própria pelas linhas
+        self.tabela = self._agrupar(self.combinadas)
+        mes = ["mes"] if self.tem_datas else []
+        self.por_dimensao = {None: self._reagrupar(mes)}
+        for dimensao in self.dimensoes:
+            self.por_dimensao[dimensao] = self._reagrupar(mes + [dimensao]) if dimensao in self.combinadas else self._agrupar([dimensao])
+        # Tabelas das combinações com dimensões fora da tabela acima, montadas quando pedidas
+        self._tabelas = {}
+
+        # Um padrão por dimensão com todos os valores, compilado uma única vez
+        self.valores = {}
+        self.padroes = {}
+        for dimensao in self.dimensoes:
+            valores = self.por_dimensao[dimensao][dimensao].dropna().unique()
+            # Valores mais longos primeiro, para "Credit Card" ganhar de um eventual "Card"
+            # (valores de uma letra ficam de fora, para não confundir com "a", "e", "o" do texto)
+            pares = sorted(((normalizar(v), v) for v in valores if len(normalizar(v)) > 1), key=lambda par: -len(par[0]))
+            self.valores[dimensao] = dict(reversed(pares))
+            if pares:
+                alternativas = "|".join(re.escape(normalizado) for normalizado, _ in pares)
+                self.padroes[dimensao] = re.compile(rf"(?<![\w-])(?:{alternativas})(?![\w-])")
+        meses = self.tabela["mes"].dropna() if self.tem_datas else pd.Series(dtype=object)
+        self.mes_min = meses.min() if len(meses) else None
+        self.mes_max = meses.max() if len(meses) else None
+        self._resultados = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Função para somar as medidas das linhas por (mês, dimensões); linhas sem data ou sem valor numa
+    # dimensão continuam na tabela, para os totais baterem com os dados
+    def _agrupar(self, dimensoes):
+        dados = self.dados
+        chaves = [dados[d] for d in dimensoes]
+        if self.tem_datas:
+            datas = dados["Sale_Date"]
+            if not pd.api.types.is_datetime64_any_dtype(datas):
+                datas = pd.to_datetime(datas, errors="coerce")
+            # Datas com fuso viram datas sem fuso (o mês no horário local), sem o aviso do to_period
+            if isinstance(datas.dtype, pd.DatetimeTZDtype):
+                datas = datas.dt.tz_localize(None)
+            chaves.insert(0,datas.dt.to_period("M").rename("mes"))
+        if not chaves:
+            chaves = [pd.Series(0, index=dados.index, name="_todos")]
+        grupos = dados.groupby(chaves, observed=True, dropna=False, sort=False)
+        partes = [grupos[self.medidas].sum().add_prefix("soma_")] if self.medidas else []
+        if "Sales_Amount" in self.medidas:
+            partes.append(grupos["Sales_Amount"].count().rename("contagem_Sales_Amount"))
+        self.colunas = [c for parte in partes for c in (parte.columns if isinstance(parte, pd.DataFrame) else [parte.name])]
+        return pd.concat(partes, axis=1).reset_index() if partes else grupos.size().rename("_linhas").reset_index()
+
+    def _reagrupar(self, chaves):
+        if not chaves:
+            return self.tabela[self.colunas].sum().to_frame().T
+        return self.tabela.groupby(chaves, observed=True, dropna=False, sort=False)[self.colunas].sum().reset_index()
+
+    # Função para interpretar o texto do chat como uma Consulta; levanta ErroConsulta se não reconhecer o pedido
+    def interpretar(self, texto):
+        texto = normalizar(texto)
+        posicoes = {medida: _primeira_ocorrencia(texto, palavras) for medida, (_, palavras) in MEDIDAS_CONSULTA.items()}
+        posicoes = {medida: p for medida, p in posicoes.items() if p is not None}
+
+        # Filtros: valores das dimensões citados no texto (ex.: "Online", "Credit Card")
+        filtros, ocupado = {}, texto
+        for dimensao, padrao in self.padroes.items():
+            citados = dict.fromkeys(m.group(0) for m in padrao.finditer(ocupado))
+            if citados:
+                filtros[dimensao] = [self.valores[dimensao][normalizado] for normalizado in citados]
+                ocupado = padrao.sub(" ", ocupado)
+
+        # Dimensão: a que vem depois de "por" ou "cada"; sem isso, a única dimensão citada que não é filtro
+        dimensao = None
+        citadas = []
+        for coluna, (_, palavras) in DIMENSOES_CONSULTA.items():
+            if coluna not in self.dimensoes:
+                continue
+            alternativas = "|".join(re.escape(p) for p in palavras)
+            if re.search(rf"\b(?:por|cada)\s+(?:{alternativas})\b", ocupado):
+                dimensao = coluna
+                break
+            if _primeira_ocorrencia(ocupado, palavras) is not None and coluna not in filtros:
+                citadas.append(coluna)
+        if dimensao is None and len(citadas) == 1:
+            dimensao = citadas[0]
+
+        periodo = self._periodo(ocupado)
+        if not posicoes and dimensao is None and not filtros and periodo is None:
+            raise ErroConsulta(AJUDA_CONSULTA)
+        # Sem medida citada, a consulta é de vendas
+        medida = min(posicoes, key=posicoes.get) if posicoes else "vendas"
+        return Consulta(medida, dimensao, filtros, periodo)
+
+    # Função para reconhecer o período (em meses) no texto normalizado; relativos ao último mês dos dados
+    def _periodo(self, texto):
+        if not self.tem_datas or self.mes_max is None:
+            return None
+        ultimo = self.mes_max
+        for tipo, padrao in PADROES_PERIODO:
+            m = padrao.search(texto)
+            if m is None:
+                continue
+            if tipo == "intervalo_meses":
+                ano_inicio = m.group(2) or m.group(4) or ultimo.year
+                ano_fim = m.group(4) or ano_inicio
+                return pd.Period(year=int(ano_inicio), month=MESES[m.group(1)], freq="M"), pd.Period(year=int(ano_fim), month=MESES[m.group(3)], freq="M")
+            if tipo == "intervalo_anos":
+                return pd.Period(year=int(m.group(1)), month=1, freq="M"), pd.Period(year=int(m.group(2)), month=12, freq="M")
+            if tipo == "trimestre":
+                ano, trimestre = int(m.group(2) or ultimo.year), int(m.group(1))
+                return pd.Period(year=ano, month=3 * trimestre - 2, freq="M"), pd.Period(year=ano, month=3 * trimestre, freq="M")
+            if tipo == "ultimos_meses":
+                return ultimo - (max(int(m.group(1)), 1) - 1), ultimo
+            if tipo == "ultimo_mes":
+                return ultimo, ultimo
+            if tipo == "ultimo_trimestre":
+                trimestre = ultimo.asfreq("Q")
+                return trimestre.asfreq("M", how="start"), trimestre.asfreq("M", how="end")
+            if tipo == "ultimo_ano":
+                return ultimo - 11, ultimo
+            if tipo == "mes":
+                mes = pd.Period(year=int(m.group(2) or ultimo.year), month=MESES[m.group(1)], freq="M")
+                return mes, mes
+            if tipo == "mes_numerico" and 1 <= int(m.group(1)) <= 12:
+                mes = pd.Period(year=int(m.group(2)), month=int(m.group(1)), freq="M")
+                return mes, mes
+            if tipo == "ano":
+                return pd.Period(year=int(m.group(1)), month=1, freq="M"), pd.Period(year=int(m.group(1)), month=12, freq="M")
+        return None
+
+    # Função para escolher a tabela da consulta: o agregado da dimensão quando só uma dimensão é usada
+    # (no agrupamento ou nos filtros), a tabela combinada quando há mais de uma e todas estão nela; senão,
+    # a tabela só com as dimensões usadas, montada na primeira vez que a combinação aparece
+    def planejar(self, consulta):
+        usadas = set(consulta.filtros) | ({consulta.dimensao} if consulta.dimensao is not None else set())
+        if len(usadas) <= 1:
+            return self.por_dimensao[next(iter(usadas)) if usadas else None]
+        if usadas <= set(self.combinadas):
+            return self.tabela
+        dimensoes = tuple(d for d in self.dimensoes if d in usadas)
+        with self._lock:
+            tabela = self._tabelas.get(dimensoes)
+        if tabela is None:
+            tabela = self._agrupar(list(dimensoes))
+            with self._lock:
+                self._tabelas[dimensoes] = tabela
+        return tabela
+
+    # Função para calcular a medida a partir das somas de cada grupo
+    def _medida(self, somas, medida):
+        necessarias = {
+            "vendas": ["soma_Sales_Amount"],
+            "lucro": ["soma_Sales_Amount", "soma_Unit_Cost", "soma_Quantity_Sold"],
+            "quantidade": ["soma_Quantity_Sold"],
+            "ticket_medio": ["soma_Sales_Amount", "contagem_Sales_Amount"],
+        }[medida]
+        faltantes = [c.split("_", 1)[1] for c in necessarias if c not in somas.columns]
+        if faltantes:
+            raise ErroConsulta(f"Os dados não têm as colunas necessárias para {MEDIDAS_CONSULTA[medida][0].lower()}: {', '.join(faltantes)}.")
+        if medida == "vendas":
+            return somas["soma_Sales_Amount"]
+        if medida == "lucro":
+            # Mesma definição dos KPIs "Lucro por ...": vendas - custo unitário somado x quantidade somada
+            return somas["soma_Sales_Amount"] - somas["soma_Unit_Cost"] * somas["soma_Quantity_Sold"]
+        if medida == "quantidade":
+            return somas["soma_Quantity_Sold"]
+        contagem = somas["contagem_Sales_Amount"]
+        return somas["soma_Sales_Amount"] / contagem.where(contagem > 0)
+
+    # Função para executar uma consulta; o resultado (Series por valor da dimensão, ou "Total") é guardado
+    def executar(self, consulta):
+        chave = consulta.chave()
+        with self._lock:
+            if chave in self._resultados:
+                self._resultados.move_to_end(chave)
+                return self._resultados[chave]
+
+        tabela = self.planejar(consulta)
+        mascara = np.ones(len(tabela), dtype=bool)
+        if consulta.periodo is not None and "mes" in tabela.columns:
+            inicio, fim = consulta.periodo
+            mascara &= ((tabela["mes"] >= inicio) & (tabela["mes"] <= fim)).to_numpy()
+        for coluna, valores in consulta.filtros.items():
+            mascara &= tabela[coluna].isin(valores).to_numpy()
+        selecionadas = tabela[mascara]
+        if consulta.dimensao is None:
+            somas = selecionadas[self.colunas].sum().to_frame("Total").T if len(selecionadas) else selecionadas[self.colunas]
+        else:
+            somas = selecionadas.groupby(consulta.dimensao, observed=True)[self.colunas].sum()
+            somas.index.name = DIMENSOES_CONSULTA[consulta.dimensao][0]
+        resultado = self._medida(somas, consulta.medida).dropna().rename(MEDIDAS_CONSULTA[consulta.medida][0])
+
+        with self._lock:
+            self._resultados[chave] = resultado
+            while len(self._resultados) > MAX_RESULTADOS_CONSULTA:
+                self._resultados.popitem(last=False)
+        return resultado
+
+    # Função para interpretar e executar um pedido do chat; retorna (consulta, resultado)
+    def responder(self, texto):
+        consulta = self.interpretar(texto)
+        return consulta, self.executar(consulta)
+
+    def tamanho_em_bytes(self):
+        tabelas = [self.tabela, *self.por_dimensao.values(), *self._tabelas.values(), *self._resultados.values()]
+        return int(sum(np.sum(t.memory_usage(deep=True)) for t in tabelas))
@@ -0,0 +1,28 @@
+import os
+import threading
+
+import yaml
+from yaml.loader import SafeLoader
+
+from instrumentacao import registrar_evento
+
+ARQUIVO_CREDENCIAIS = "credentials.yaml"
+
+# Configuração lida uma vez por processo; só é relida quando o arquivo muda (caminho, data de modificação)
+_config_em_cache = {}
+_lock = threading.Lock()
+
+
+# Função para carregar o credentials.yaml sem reler e reinterpretar o YAML a cada execução do script
+def carregar_config(caminho=ARQUIVO_CREDENCIAIS):
+    caminho = os.path.abspath(caminho)
+    modificado = os.path.getmtime(caminho)
+    with _lock:
+        em_cache = _config_em_cache.get(caminho)
+        if em_cache is not None and em_cache[0] == modificado:
+            return em_cache[1]
+        with open(caminho, 'r', encoding='utf-8') as file:
+            config = yaml.load(file, Loader=SafeLoader)
+        _config_em_cache[caminho] = (modificado, config)
+    registrar_evento("credenciais_carregadas", arquivo=caminho, usuarios=len(((config or {}).get('credentials') or {}).get('usernames') or {}))
+    return config
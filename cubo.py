@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+from agregacao import DIMENSOES_KPI, MEDIDAS_KPI, ParcialKPI
+from serie_temporal import SerieTemporal
+
+# Dimensões usadas pelos filtros interativos (formam a chave do cubo junto com o dia)
+DIMENSOES_FILTRO = ["Product_Category", "Sales_Channel"]
+# Dimensões dos KPIs que não fazem parte dos filtros e ganham um cubo próprio
+DIMENSOES_EXTRAS = [d for d in list(DIMENSOES_KPI) + ["Customer_Type"] if d not in DIMENSOES_FILTRO]
+# Nomes das colunas do cubo para cada função de agregação
+PREFIXOS = {"sum": "soma", "count": "contagem", "max": "max", "min": "min"}
+
+
+def _achatar_colunas(tabela):
+    tabela.columns = [f"{PREFIXOS[funcao]}_{coluna}" for coluna, funcao in tabela.columns]
+    return tabela
+
+
+class CuboKPI:
+    """Agregados parciais por (dia, Product_Category, Sales_Channel), montados uma vez por dataset.
+
+    Os KPIs filtrados saem de fatias do cubo em vez de uma nova varredura das linhas."""
+
+    def __init__(self, dados):
+        self.colunas = dados.columns.tolist()
+        tipos = dados.dtypes.to_dict()
+        self.numericas = [c for c in self.colunas if pd.api.types.is_numeric_dtype(tipos[c]) and not pd.api.types.is_bool_dtype(tipos[c])]
+
+        chaves = []
+        if "Sale_Date" in self.colunas:
+            datas = dados["Sale_Date"]
+            if not pd.api.types.is_datetime64_any_dtype(datas):
+                datas = pd.to_datetime(datas, errors="coerce")
+            # Datas com fuso viram datas sem fuso, para comparar com as datas dos filtros
+            if isinstance(datas.dtype, pd.DatetimeTZDtype):
+                datas = datas.dt.tz_localize(None)
+            chaves.append(datas.dt.floor("D").rename("dia"))
+        chaves += [dados[d] for d in DIMENSOES_FILTRO if d in self.colunas]
+        if not chaves:
+            chaves = [pd.Series(0, index=dados.index, name="_todos")]
+
+        grupos = dados.groupby(chaves, observed=True, dropna=False, sort=False)
+        partes = [grupos.size().rename("_linhas")]
+        if self.numericas:
+            partes.append(_achatar_colunas(grupos[self.numericas].agg(["sum", "count", "max", "min"])))
+        if "Sale_Date" in self.colunas:
+            partes.append(datas.groupby(chaves, observed=True, dropna=False, sort=False).agg(["min", "max"]).add_prefix("data_"))
+        self.base = pd.concat(partes, axis=1).reset_index()
+
+        # Medidas somadas por dimensão extra (ex.: Região/Representante, Tipo de Cliente), por dia e por mês.
+        # A tabela por dia pode ter quase tantas linhas quanto os dados (ex.: muitos representantes); os filtros
+        # leem os meses inteiros do período na tabela mensal e só os meses das pontas na tabela por dia,
+        # ordenada por dia para esses meses serem achados por busca binária. Sem filtro de categoria e canal,
+        # a tabela mensal usada é a de totais (mês x valor da dimensão), ainda menor
+        self.medidas = [m for m in MEDIDAS_KPI if m in self.numericas]
+        self.extras = {}
+        self.extras_mensais = {}
+        self.extras_totais = {}
+        self._dias_extras = {}
+        if "Sales_Amount" in self.numericas:
+            for dimensao in DIMENSOES_EXTRAS:
+                if dimensao in self.colunas:
+                    tabela = dados.groupby(chaves + [dados[dimensao]], observed=True, dropna=False, sort=False)[self.medidas].agg(["sum", "count"])
+                    tabela = _achatar_colunas(tabela).reset_index()
+                    if "dia" in tabela.columns:
+                        tabela = tabela.sort_values("dia", kind="stable", na_position="last", ignore_index=True)
+                        self._dias_extras[dimensao] = tabela["dia"].to_numpy()
+                        self.extras_mensais[dimensao] = self._por_mes(tabela, [d for d in DIMENSOES_FILTRO if d in tabela.columns] + [dimensao])
+                        self.extras_totais[dimensao] = self._por_mes(tabela, [dimensao])
+                    self.extras[dimensao] = tabela
+
+    # Função para somar uma tabela por dia em meses; a coluna dia passa a ser o primeiro dia do mês
+    def _por_mes(self, tabela, dimensoes):
+        meses = pd.Series(tabela["dia"].to_numpy().astype("datetime64[M]").astype("datetime64[ns]"), index=tabela.index, name="dia")
+        chaves = [meses] + [tabela[d] for d in dimensoes]
+        colunas = [c for c in tabela.columns if c.startswith(("soma_", "contagem_"))]
+        return tabela.groupby(chaves, observed=True, dropna=False, sort=True)[colunas].sum().reset_index()
+
+    # Função para recortar a tabela de uma dimensão extra pelos filtros, com as linhas somadas por mês
+    # nos meses inteiros do período e por dia nos meses cortados pelas datas (mesmas somas que a tabela por dia)
+    def _extras_filtrados(self, dimensao, data_inicio, data_fim, categoria, canal):
+        if dimensao not in self.extras_mensais:
+            tabela = self.extras[dimensao]
+            return tabela[self._mascara(tabela, data_inicio, data_fim, categoria, canal)]
+        sem_filtros = all(valor in (None, "Todos") for valor in (categoria, canal))
+        mensal = self.extras_totais[dimensao] if sem_filtros else self.extras_mensais[dimensao]
+        if data_inicio is None and data_fim is None:
+            return mensal[self._mascara(mensal, None, None, categoria, canal)]
+        # Período em dias [inicio, fim) e, dentro dele, os meses inteiros [primeiro_mes, fim_meses)
+        inicio = fim = primeiro_mes = fim_meses = None
+        if data_inicio is not None:
+            inicio = pd.Timestamp(data_inicio).ceil("D")
+            primeiro_mes = inicio if inicio.day == 1 else inicio + pd.offsets.MonthBegin(1)
+        if data_fim is not None:
+            fim = pd.Timestamp(data_fim).floor("D") + pd.Timedelta(days=1)
+            fim_meses = fim if fim.day == 1 else fim - pd.offsets.MonthBegin(1)
+
+        # Posições na tabela por dia (ordenada, com os dias vazios no fim)
+        dias = self._dias_extras[dimensao]
+        validos = len(dias) - int(np.isnat(dias).sum())
+        posicao = lambda data, padrao: padrao if data is None else int(np.searchsorted(dias[:validos], np.datetime64(data), side="left"))
+        inicio_pos, fim_pos = posicao(inicio, 0), posicao(fim, validos)
+        por_dia = self.extras[dimensao]
+        por_dia = por_dia[mensal.columns] if sem_filtros else por_dia
+        if primeiro_mes is None or fim_meses is None or primeiro_mes < fim_meses:
+            inteiros = np.ones(len(mensal), dtype=bool)
+            if primeiro_mes is not None:
+                inteiros &= (mensal["dia"] >= primeiro_mes).to_numpy()
+            if fim_meses is not None:
+                inteiros &= (mensal["dia"] < fim_meses).to_numpy()
+            partes = [mensal[inteiros], por_dia.iloc[inicio_pos:posicao(primeiro_mes, inicio_pos)], por_dia.iloc[posicao(fim_meses, fim_pos):fim_pos]]
+        else:
+            partes = [por_dia.iloc[inicio_pos:fim_pos]]
+        partes = [parte for parte in partes if len(parte)] or [por_dia.iloc[:0]]
+        recorte = pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+        return recorte[self._mascara(recorte, None, None, categoria, canal)]
+
+    def _mascara(self, tabela, data_inicio, data_fim, categoria, canal):
+        mascara = np.ones(len(tabela), dtype=bool)
+        if "dia" in tabela.columns:
+            if data_inicio is not None:
+                mascara &= (tabela["dia"] >= pd.Timestamp(data_inicio)).to_numpy()
+            if data_fim is not None:
+                mascara &= (tabela["dia"] <= pd.Timestamp(data_fim)).to_numpy()
+        for dimensao, valor in (("Product_Category", categoria), ("Sales_Channel", canal)):
+            if valor not in (None, "Todos") and dimensao in tabela.columns:
+                mascara &= (tabela[dimensao] == valor).to_numpy()
+        return mascara
+
+    def _agregar(self, tabela, dimensao):
+        colunas = [f"{prefixo}_{m}" for m in self.medidas for prefixo in ("soma", "contagem")]
+        return tabela.groupby(dimensao, observed=True)[colunas].sum()
+
+    # Função para obter o ParcialKPI das linhas que passam nos filtros
+    def parcial(self, data_inicio=None, data_fim=None, categoria="Todos", canal="Todos"):
+        base = self.base[self._mascara(self.base, data_inicio, data_fim, categoria, canal)]
+        parcial = ParcialKPI()
+        parcial.linhas = int(base["_linhas"].sum())
+        parcial.colunas = list(self.colunas)
+        if parcial.linhas == 0:
+            return parcial
+
+        for coluna in self.numericas:
+            contagem = base[f"contagem_{coluna}"].sum()
+            if contagem > 0:
+                parcial.estatisticas[coluna] = [base[f"soma_{coluna}"].sum(), int(contagem), base[f"max_{coluna}"].max(), base[f"min_{coluna}"].min()]
+
+        if "data_min" in base.columns and base["data_min"].notna().any():
+            parcial.data_min, parcial.data_max = base["data_min"].min(), base["data_max"].max()
+
+        if "Sales_Amount" in self.numericas:
+            for dimensao in DIMENSOES_FILTRO:
+                if dimensao in base.columns:
+                    parcial.agregados[dimensao] = self._agregar(base, dimensao)
+            extras = {dimensao: self._extras_filtrados(dimensao, data_inicio, data_fim, categoria, canal) for dimensao in self.extras}
+            for dimensao, tabela in extras.items():
+                parcial.agregados[dimensao] = self._agregar(tabela, dimensao)
+            if "dia" in base.columns:
+                colunas = {"_linhas": "linhas", **{f"soma_{m}": m for m in self.medidas}}
+                dimensoes = {d: base for d in DIMENSOES_FILTRO if d in base.columns}
+                parcial.serie = SerieTemporal.de_agregados(base, colunas, {**dimensoes, **extras})
+        return parcial
+
+    # Função para calcular os KPIs filtrados, com o mesmo resultado de calcular_kpis sobre as linhas filtradas
+    def kpis(self, data_inicio=None, data_fim=None, categoria="Todos", canal="Todos"):
+        return self.parcial(data_inicio, data_fim, categoria, canal).kpis()
@@ -0,0 +1,233 @@
+import math
+import numbers
+import os
+import re
+import tempfile
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from agregacao import DIMENSOES_KPI, JANELA_MEDIA_MOVEL
+
+
+# Linhas por tabela no PDF: tabelas longas são quebradas em blocos para a paginação não refazer a tabela inteira
+LINHAS_POR_TABELA_PDF = 40
+# Tamanho (em MB) a partir do qual o PDF ou o Excel em construção sai da memória para um arquivo temporário
+LIMITE_MEMORIA_EXPORTACAO_MB = int(os.environ.get("KPI_EXPORTACAO_MEMORIA_MB", "16"))
+
+
+def _formatar_valor(valor):
+    if isinstance(valor, (int, float)):
+        return f"{valor:.2f}"
+    return str(valor)
+
+
+# Função para montar uma tabela do PDF já dividida em blocos de LINHAS_POR_TABELA_PDF linhas
+def _tabelas_pdf(cabecalho, linhas, larguras):
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle
+
+    estilo = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+    for inicio in range(0, len(linhas), LINHAS_POR_TABELA_PDF):
+        tabela = Table([cabecalho] + linhas[inicio:inicio + LINHAS_POR_TABELA_PDF], colWidths=larguras, repeatRows=1)
+        tabela.setStyle(estilo)
+        yield tabela
+
+
+# Função para exportar para PDF
+# KPIs simples vão numa tabela de resumo e cada KPI em dicionário (ex.: vendas por região) ganha sua seção.
+# imagens: lista de (título, PNG em bytes), ex.: os gráficos já renderizados no cache do painel.
+# O documento é gravado num SpooledTemporaryFile: fica na memória até LIMITE_MEMORIA_EXPORTACAO_MB e depois vai para o disco.
+def exportar_pdf(kpis, filename="relatorio_kpis.pdf", imagens=None):
+    # O reportlab só é importado na primeira exportação em PDF
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.utils import ImageReader
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA_EXPORTACAO_MB * 1024 * 1024)
+    doc = SimpleDocTemplate(buffer, pagesize=letter, title="Relatório de KPIs")
+    elements = []
+    styles = getSampleStyleSheet()
+    title = Paragraph("Relatório de KPIs", styles['Heading1'])
+    elements.append(title)
+    elements.append(Paragraph(f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
+    elements.append(Spacer(1, 12))
+
+    larguras = [doc.width * 0.6, doc.width * 0.4]
+    resumo = [[kpi, _formatar_valor(valor)] for kpi, valor in kpis.items() if not isinstance(valor, dict)]
+    elements.extend(_tabelas_pdf(["KPI", "Valor"], resumo, larguras))
+
+    for kpi, valor in kpis.items():
+        if not isinstance(valor, dict):
+            continue
+        elements.append(Paragraph(kpi, styles['Heading2']))
+        if not valor:
+            elements.append(Paragraph("Sem dados disponíveis.", styles['Normal']))
+            continue
+        linhas = [[str(item), _formatar_valor(v)] for item, v in valor.items()]
+        elements.extend(_tabelas_pdf(["Item", "Valor"], linhas, larguras))
+
+    for titulo, imagem in imagens or []:
+        if not imagem:
+            continue
+        largura, altura = ImageReader(BytesIO(imagem)).getSize()
+        escala = min(doc.width / largura, (doc.height - 60) / altura, 1)
+        elements.append(PageBreak())
+        elements.append(Paragraph(titulo, styles['Heading2']))
+        elements.append(Image(BytesIO(imagem), width=largura * escala, height=altura * escala))
+
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+# Função para exportar para CSV
+def exportar_csv(kpis, filename="relatorio_kpis.csv"):
+    df_kpis = pd.DataFrame(list(kpis.items()), columns=["KPI", "Valor"])
+    buffer = BytesIO()
+    df_kpis.to_csv(buffer, index=False)
+    buffer.seek(0)
+    return buffer
+
+
+# Linhas de dados por aba no Excel (o limite do formato é 1.048.576 linhas, incluindo o cabeçalho)
+LIMITE_LINHAS_EXCEL = 1_048_575
+# Linhas convertidas por vez ao gravar os dados brutos
+TAMANHO_BLOCO_EXCEL = 10_000
+CARACTERES_INVALIDOS_ABA = re.compile(r"[\[\]:*?/\\]")
+# Nomes curtos das abas dos KPIs em dicionário (o Excel limita o nome da aba a 31 caracteres)
+NOMES_ABAS = {
+    "Crescimento de Vendas Mensal (%)": "Crescimento Mensal",
+    "Crescimento de Vendas Anual (%)": "Crescimento Anual",
+    f"Média Móvel de Vendas ({JANELA_MEDIA_MOVEL} meses)": f"Média Móvel {JANELA_MEDIA_MOVEL} Meses",
+    "Receita Acumulada": "Receita Acumulada",
+    "Ticket Médio por Tipo de Cliente": "Ticket Médio",
+    **{f"Tendência de Vendas por {rotulo} (R$/mês)": f"Tendência {rotulo}" for rotulo in DIMENSOES_KPI.values()},
+}
+
+
+def _importar_xlsxwriter():
+    try:
+        import xlsxwriter
+    except ImportError as e:
+        raise RuntimeError("O pacote xlsxwriter é necessário para exportar para Excel. Instale com 'pip install xlsxwriter'.") from e
+    return xlsxwriter
+
+
+def _nome_aba(nome, usados):
+    nome = CARACTERES_INVALIDOS_ABA.sub("-", nome)
+    if len(nome) > 31:
+        # Nomes sem nome curto em NOMES_ABAS são cortados no último espaço, sem partir palavras
+        nome = nome[:32].rsplit(" ", 1)[0] if " " in nome[:32] else nome[:31]
+    nome = nome or "Aba"
+    base, n = nome, 2
+    while nome.lower() in usados:
+        sufixo = f" ({n})"
+        nome, n = base[:31 - len(sufixo)] + sufixo, n + 1
+    usados.add(nome.lower())
+    return nome
+
+
+# Números e datas do numpy (ex.: np.int64 de uma contagem) viram tipos do Python, para serem gravados como
+# número/data e não como texto; inf e NaN (ex.: crescimento sobre um mês sem vendas) ficam como célula vazia
+def _valor_celula(valor):
+    if isinstance(valor, np.datetime64):
+        valor = None if np.isnat(valor) else pd.Timestamp(valor)
+    elif isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    if isinstance(valor, (numbers.Real, str, datetime)) or valor is None:
+        return valor
+    return str(valor)
+
+
+# Função para separar os KPIs nas abas do Excel: (nome da aba, cabeçalho, linhas)
+# Vendas e lucro da mesma dimensão ficam lado a lado; os demais KPIs em dicionário ganham uma aba cada
+def abas_kpis(kpis):
+    simples = [[kpi, _valor_celula(valor)] for kpi, valor in kpis.items() if not isinstance(valor, dict)]
+    simples.append(["Data do Relatório", datetime.now().strftime('%d/%m/%Y %H:%M')])
+    abas = [("KPIs", ["KPI", "Valor"], simples)]
+    usados = set()
+    for rotulo in DIMENSOES_KPI.values():
+        vendas = kpis.get(f"Vendas por {rotulo}")
+        if not isinstance(vendas, dict):
+            continue
+        lucro = kpis.get(f"Lucro por {rotulo}")
+        usados.update({f"Vendas por {rotulo}", f"Lucro por {rotulo}"})
+        if isinstance(lucro, dict):
+            linhas = [[_valor_celula(chave), _valor_celula(valor), _valor_celula(lucro.get(chave))] for chave, valor in vendas.items()]
+            abas.append((rotulo, [rotulo, "Vendas", "Lucro"], linhas))
+        else:
+            abas.append((rotulo, [rotulo, "Vendas"], [[_valor_celula(chave), _valor_celula(valor)] for chave, valor in vendas.items()]))
+    for kpi, valor in kpis.items():
+        if isinstance(valor, dict) and kpi not in usados:
+            abas.append((NOMES_ABAS.get(kpi, kpi), ["Item", kpi], [[_valor_celula(chave), _valor_celula(v)] for chave, v in valor.items()]))
+    return abas
+
+
+# Função para gravar as linhas brutas em blocos, continuando em novas abas quando passar do limite do Excel
+def _gravar_dados_excel(livro, dados, nome, usados, formato_cabecalho, ao_avancar=None):
+    cabecalho = [str(coluna) for coluna in dados.columns]
+    aba, linha, parte = None, LIMITE_LINHAS_EXCEL, 0
+    for inicio in range(0, len(dados), TAMANHO_BLOCO_EXCEL):
+        bloco = dados.iloc[inicio:inicio + TAMANHO_BLOCO_EXCEL]
+        # object + None: NaN/NaT viram células vazias, inteiros e floats do numpy viram números do Python
+        bloco = bloco.astype(object).where(bloco.notna(), None)
+        for valores in bloco.itertuples(index=False, name=None):
+            if linha >= LIMITE_LINHAS_EXCEL:
+                parte += 1
+                aba = livro.add_worksheet(_nome_aba(nome if parte == 1 else f"{nome} {parte}", usados))
+                aba.write_row(0, 0, cabecalho, formato_cabecalho)
+                aba.set_column(0, len(cabecalho) - 1, 16)
+                linha = 0
+            linha += 1
+            aba.write_row(linha, 0, [_valor_celula(v) for v in valores])
+        if ao_avancar is not None:
+            ao_avancar(min(inicio + TAMANHO_BLOCO_EXCEL, len(dados)), len(dados))
+
+
+# Função para exportar para Excel
+# Uma aba por detalhamento (categoria, canal, região/representante, crescimento mensal, ticket médio) e,
+# se dados for informado, as linhas brutas (ex.: as linhas filtradas). O xlsxwriter em modo constant_memory
+# grava cada linha no disco assim que ela é escrita, então a memória não cresce com o número de linhas.
+# ao_avancar(linhas_gravadas, total) é chamada a cada bloco de linhas brutas gravado.
+def exportar_excel(kpis, filename="relatorio_kpis.xlsx", dados=None, nome_dados="Dados Filtrados", ao_avancar=None):
+    xlsxwriter = _importar_xlsxwriter()
+    output = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA_EXPORTACAO_MB * 1024 * 1024)
+    livro = xlsxwriter.Workbook(output, {
+        "constant_memory": True,
+        "default_date_format": "dd/mm/yyyy",
+        # Texto vindo da planilha do usuário é gravado como texto, nunca como fórmula ou link
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+        # Datas com fuso (ex.: Sale_Date lida com "-03:00") são gravadas no horário local, sem o fuso
+        "remove_timezone": True,
+    })
+    formato_cabecalho = livro.add_format({"bold": True, "bg_color": "#D9D9D9"})
+    usados = set()
+    for nome, cabecalho, linhas in abas_kpis(kpis):
+        aba = livro.add_worksheet(_nome_aba(nome, usados))
+        aba.set_column(0, 0, 32)
+        aba.set_column(1, len(cabecalho) - 1, 18)
+        aba.write_row(0, 0, cabecalho, formato_cabecalho)
+        for numero, valores in enumerate(linhas, start=1):
+            aba.write_row(numero, 0, valores)
+    if dados is not None and len(dados) > 0:
+        _gravar_dados_excel(livro, dados, nome_dados, usados, formato_cabecalho, ao_avancar)
+    livro.close()
+    output.seek(0)
+    return output
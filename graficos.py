@@ -0,0 +1,157 @@
+import os
+from io import BytesIO
+
+import pandas as pd
+
+from cache_dados import CacheLRU
+from serie_temporal import SerieTemporal
+
+# Limite de memória (em MB) das imagens de gráficos guardadas
+LIMITE_CACHE_GRAFICOS_MB = int(os.environ.get("KPI_CACHE_GRAFICOS_MB", "64"))
+# Quantidade máxima de pontos da série temporal exibida (acima disso a série é reamostrada)
+MAX_PONTOS_SERIE = 180
+# Granularidades da série temporal, da mais fina para a mais grossa, com a duração aproximada em dias
+FREQUENCIAS = [("diaria", 1), ("semanal", 7), ("mensal", 30), ("trimestral", 91), ("anual", 365)]
+CORES_CANAL = ['#FF6B6B', '#4ECDC4', '#45B7D1']
+
+# Imagens renderizadas, compartilhadas entre as sessões; chave (dataset, filtros, tipo de gráfico, formato)
+CACHE_GRAFICOS = CacheLRU(LIMITE_CACHE_GRAFICOS_MB * 1024 * 1024)
+
+
+# Função para escolher a granularidade que mantém a série dentro de MAX_PONTOS_SERIE pontos
+def frequencia_exibicao(data_min, data_max, max_pontos=MAX_PONTOS_SERIE):
+    dias = (data_max - data_min).days + 1
+    for frequencia, duracao in FREQUENCIAS:
+        if dias / duracao <= max_pontos:
+            return frequencia
+    return FREQUENCIAS[-1][0]
+
+
+# Função para obter as vendas ao longo do tempo na resolução de exibição
+# serie: SerieTemporal já calculada junto com os KPIs (ParcialKPI.serie); sem ela, os dados são lidos uma vez
+def serie_vendas_tempo(dados=None, serie=None, max_pontos=MAX_PONTOS_SERIE):
+    if serie is None:
+        serie = SerieTemporal.de_dados(dados, ["Sales_Amount"])
+    if serie.vazia:
+        return pd.Series(dtype="float64")
+    dias = serie.diaria.index
+    vendas = serie.serie(frequencia_exibicao(dias.min(), dias.max(), max_pontos))
+    return vendas.set_axis(vendas.index.to_timestamp())
+
+
+# Função para criar gráficos
+# As figuras são criadas com matplotlib.figure.Figure (fora do pyplot), então não ficam registradas
+# no gerenciador global e são liberadas assim que deixam de ser referenciadas
+# serie: SerieTemporal dos KPIs, reaproveitada no gráfico de vendas ao longo do tempo
+def criar_graficos(dados, serie=None):
+    if dados is None or dados.empty:
+        return None
+
+    # matplotlib e seaborn só são importados quando o primeiro gráfico é desenhado
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(12, 10))
+    axes = fig.subplots(2, 2)
+    fig.suptitle("Relatórios Visuais de KPIs", fontsize=16)
+
+    ax1, ax2, ax3, ax4 = axes[0, 0], axes[0, 1], axes[1, 0], axes[1, 1]
+
+    # Gráfico 1: Vendas por Categoria (Gráfico de Barras)
+    if "Product_Category" in dados.columns and "Sales_Amount" in dados.columns:
+        vendas_categoria = dados.groupby("Product_Category", observed=True)["Sales_Amount"].sum().dropna()
+        if not vendas_categoria.empty:
+            sns.barplot(x=vendas_categoria.index, y=vendas_categoria.values, ax=ax1, palette="Blues_d")
+            ax1.set_title("Vendas por Categoria")
+            ax1.set_xlabel("Categoria")
+            ax1.set_ylabel("Valor (R$)")
+            ax1.tick_params(axis='x', rotation=45)
+        else:
+            ax1.text(0.5, 0.5, "Sem dados disponíveis", ha='center', va='center')
+
+    # Gráfico 2: Vendas por Canal (Gráfico de Pizza)
+    if "Sales_Channel" in dados.columns and "Sales_Amount" in dados.columns:
+        vendas_canal = dados.groupby("Sales_Channel", observed=True)["Sales_Amount"].sum().dropna()
+        if not vendas_canal.empty:
+            vendas_canal.plot(kind="pie", ax=ax2, autopct='%1.1f%%', colors=CORES_CANAL)
+            ax2.set_title("Vendas por Canal")
+        else:
+            ax2.text(0.5, 0.5, "Sem dados disponíveis", ha='center', va='center')
+
+    # Gráfico 3: Vendas por Região/Representante (Gráfico de Linhas)
+    if "Region_and_Sales_Rep" in dados.columns and "Sales_Amount" in dados.columns:
+        vendas_regiao = dados.groupby("Region_and_Sales_Rep", observed=True)["Sales_Amount"].sum().dropna()
+        if not vendas_regiao.empty:
+            vendas_regiao.plot(kind="line", ax=ax3, marker='o', color='#FFA500', linewidth=2)
+            ax3.set_title("Vendas por Região/Representante")
+            ax3.set_xlabel("Região/Representante")
+            ax3.set_ylabel("Valor (R$)")
+            ax3.tick_params(axis='x', rotation=45)
+        else:
+            ax3.text(0.5, 0.5, "Sem dados disponíveis", ha='center', va='center')
+
+    # Gráfico 4: Vendas ao Longo do Tempo (Gráfico de Linhas), reamostrado para a resolução de exibição
+    if "Sale_Date" in dados.columns and "Sales_Amount" in dados.columns:
+        vendas_tempo = serie_vendas_tempo(dados, serie)
+        if not vendas_tempo.empty:
+            vendas_tempo.plot(kind="line", ax=ax4, marker='o' if len(vendas_tempo) <= 60 else None, color='#2E8B57', linewidth=2)
+            ax4.set_title("Vendas ao Longo do Tempo")
+            ax4.set_xlabel("Data")
+            ax4.set_ylabel("Valor (R$)")
+        else:
+            ax4.text(0.5, 0.5, "Sem dados disponíveis", ha='center', va='center')
+
+    fig.tight_layout()
+    return fig
+
+
+# Função para criar o gráfico de vendas de uma dimensão (seção "Navegação por Categorias")
+def grafico_vendas_dimensao(vendas, dimensao):
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    if dimensao == "Sales_Channel":
+        vendas.plot(kind="pie", ax=ax, autopct='%1.1f%%', colors=CORES_CANAL)
+        ax.set_title("Vendas por Canal")
+    else:
+        titulo = "Vendas por Categoria" if dimensao == "Product_Category" else "Vendas por Região/Representante"
+        sns.barplot(x=vendas.index, y=vendas.values, ax=ax, palette="Blues_d" if dimensao == "Product_Category" else "Purples_d")
+        ax.set_title(titulo)
+        ax.tick_params(axis='x', rotation=45)
+    return fig
+
+
+# Função para renderizar a figura em bytes (PNG ou SVG) e liberar seus recursos
+def renderizar(fig, formato="png", dpi=100):
+    buffer = BytesIO()
+    try:
+        fig.savefig(buffer, format=formato, dpi=dpi)
+    finally:
+        fig.clear()
+    return buffer.getvalue()
+
+
+# Função para obter a imagem de um gráfico já renderizado (None se ainda não estiver no cache)
+def grafico_guardado(chave, formato="png"):
+    if chave is None or chave[0] is None:
+        return None
+    return CACHE_GRAFICOS.obter(chave + (formato,))
+
+
+# Função para obter a imagem de um gráfico do cache, renderizando só na primeira vez
+# chave: (hash do dataset, filtros, tipo do gráfico); sem hash do dataset a imagem não é guardada
+def grafico_em_cache(chave, gerar_figura, formato="png"):
+    guardar = chave is not None and chave[0] is not None
+    if guardar:
+        imagem = CACHE_GRAFICOS.obter(chave + (formato,))
+        if imagem is not None:
+            return imagem
+    fig = gerar_figura()
+    if fig is None:
+        return None
+    imagem = renderizar(fig, formato)
+    if guardar:
+        CACHE_GRAFICOS.guardar(chave + (formato,), imagem)
+    return imagem
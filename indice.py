@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# Dimensões usadas pelos filtros interativos
+COLUNAS_FILTRO = {"categoria": "Product_Category", "canal": "Sales_Channel"}
+
+
+# Datas com fuso (ex.: "2024-01-02T10:00:00+00:00") viram datas sem fuso, como em serie_temporal._dias,
+# para que o to_numpy() dê datetime64 e não um array de objetos
+def _datas(dados):
+    datas = dados["Sale_Date"]
+    if isinstance(datas.dtype, pd.DatetimeTZDtype):
+        datas = datas.dt.tz_localize(None)
+    return datas.to_numpy()
+
+
+# Função para verificar se as datas já estão em ordem crescente, com as datas vazias (NaT) no fim
+def esta_ordenado_por_data(dados):
+    datas = _datas(dados)
+    vazias = np.isnat(datas)
+    validas = len(datas) - int(vazias.sum())
+    return not vazias[:validas].any() and bool((datas[1:validas] >= datas[:validas - 1]).all())
+
+
+# Função para ordenar as linhas por Sale_Date uma única vez no carregamento, para permitir recortes por busca binária
+def ordenar_por_data(dados):
+    if "Sale_Date" not in dados.columns or not pd.api.types.is_datetime64_any_dtype(dados["Sale_Date"]):
+        return dados
+    if not esta_ordenado_por_data(dados):
+        dados = dados.sort_values("Sale_Date", kind="stable", na_position="last", ignore_index=True)
+    # O recorte de linhas preserva a ordem, então a marca continua válida para os subconjuntos
+    dados.attrs["ordenado_por_data"] = True
+    return dados
+
+
+# Função para achar as posições [inicio, fim) das linhas entre duas datas (inclusive) com busca binária
+# Com alguma data informada, as linhas sem data (NaT, no fim) ficam de fora
+def intervalo_datas(dados, data_inicio=None, data_fim=None):
+    datas = _datas(dados)
+    inicio, fim = 0, len(datas)
+    if data_inicio is not None:
+        # O numpy ordena NaT depois de todas as datas, então a busca acha a primeira linha sem data
+        fim = int(np.searchsorted(datas, np.datetime64("NaT").astype(datas.dtype), side="left"))
+        inicio = int(np.searchsorted(datas, np.datetime64(pd.Timestamp(data_inicio)).astype(datas.dtype), side="left"))
+    if data_fim is not None:
+        limite = pd.Timestamp(data_fim).normalize() + pd.Timedelta(days=1)
+        fim = int(np.searchsorted(datas, np.datetime64(limite).astype(datas.dtype), side="left"))
+    return inicio, max(inicio, fim)
+
+
+class IndiceDados:
+    """Índice de um dataset ordenado por Sale_Date: recorte por datas em O(log n) e máscaras dos filtros reaproveitadas."""
+
+    def __init__(self, dados):
+        if "Sale_Date" in dados.columns and not dados.attrs.get("ordenado_por_data"):
+            dados = ordenar_por_data(dados)
+        self.dados = dados
+        self.tem_datas = bool(dados.attrs.get("ordenado_por_data"))
+        self._mascaras = {}
+        self._valores = {}
+        self.data_min = self.data_max = None
+        if self.tem_datas:
+            datas = _datas(dados)
+            validas = len(datas) - int(np.isnat(datas).sum())
+            if validas:
+                self.data_min, self.data_max = pd.Timestamp(datas[0]), pd.Timestamp(datas[validas - 1])
+
+    # Memória própria do índice (o DataFrame referenciado já é contado no cache dos dados)
+    def tamanho_em_bytes(self):
+        return sum(m.nbytes for m in self._mascaras.values()) + sum(len(v) * 64 for v in self._valores.values())
+
+    # Função para obter (e guardar) a máscara booleana de coluna == valor sobre o dataset inteiro
+    def mascara(self, coluna, valor):
+        chave = (coluna, valor)
+        if chave not in self._mascaras:
+            self._mascaras[chave] = (self.dados[coluna] == valor).to_numpy()
+        return self._mascaras[chave]
+
+    # Função para listar (uma vez) os valores distintos de uma coluna de filtro
+    def valores(self, coluna):
+        if coluna not in self._valores:
+            self._valores[coluna] = list(self.dados[coluna].dropna().unique())
+        return self._valores[coluna]
+
+    def _selecao(self, data_inicio, data_fim, categoria, canal):
+        inicio, fim = intervalo_datas(self.dados, data_inicio, data_fim) if self.tem_datas else (0, len(self.dados))
+        selecao = None
+        for filtro, valor in (("categoria", categoria), ("canal", canal)):
+            coluna = COLUNAS_FILTRO[filtro]
+            if valor not in (None, "Todos") and coluna in self.dados.columns:
+                parte = self.mascara(coluna, valor)[inicio:fim]
+                selecao = parte if selecao is None else selecao & parte
+        return inicio, fim, selecao
+
+    # Função para obter só as posições das linhas que passam nos filtros, sem copiar as colunas
+    # (ex.: contar as linhas e exibir as primeiras com self.dados.iloc[posicoes[:1000]])
+    def posicoes(self, data_inicio=None, data_fim=None, categoria="Todos", canal="Todos"):
+        inicio, fim, selecao = self._selecao(data_inicio, data_fim, categoria, canal)
+        if selecao is None:
+            return np.arange(inicio, fim)
+        return inicio + np.flatnonzero(selecao)
+
+    # Função para recortar as linhas pelos filtros: fatia contígua por datas e máscaras só dentro da fatia
+    def filtrar(self, data_inicio=None, data_fim=None, categoria="Todos", canal="Todos"):
+        inicio, fim, selecao = self._selecao(data_inicio, data_fim, categoria, canal)
+        fatia = self.dados.iloc[inicio:fim]
+        resultado = fatia if selecao is None else fatia[selecao]
+        # O subconjunto não é o dataset em cache: não herda a chave dos agregados do dataset inteiro
+        resultado.attrs.pop("chave_cache", None)
+        return resultado
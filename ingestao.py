@@ -0,0 +1,132 @@
+import os
+
+import pandas as pd
+
+from agregacao import ParcialKPI
+from indice import ordenar_por_data
+from tipos import otimizar_tipos
+
+COLUNAS_ESPERADAS = ["Product_ID", "Sale_Date", "Sales_Rep_Region", "Sales_Amount", "Quantity_Sold", "Product_Category", "Unit_Cost", "Unit_Price", "Customer_Type", "Discount", "Payment_Method", "Sales_Channel", "Region_and_Sales_Rep"]
+# Colunas esperadas que entram nas somas dos KPIs
+COLUNAS_NUMERICAS = ["Sales_Amount", "Quantity_Sold", "Unit_Cost", "Unit_Price", "Discount"]
+# Linhas por bloco na leitura em streaming
+TAMANHO_BLOCO = int(os.environ.get("KPI_TAMANHO_BLOCO", "50000"))
+EXTENSOES_SUPORTADAS = ["xlsx", "csv"]
+
+
+class ErroIngestao(ValueError):
+    pass
+
+
+def _extensao(nome):
+    return os.path.splitext(nome or "")[1].lower().lstrip(".")
+
+
+# Função para converter as colunas numéricas lidas como texto (ex.: um bloco do CSV com "abc" no meio dos valores)
+# Texto com número vira número; qualquer outro valor é um erro, para o bloco não ficar de fora das somas
+def _validar_numericas(dados):
+    for coluna in COLUNAS_NUMERICAS:
+        if coluna not in dados.columns or pd.api.types.is_numeric_dtype(dados[coluna]):
+            continue
+        convertidos = pd.to_numeric(dados[coluna], errors="coerce")
+        invalidos = dados[coluna][convertidos.isna() & dados[coluna].notna()]
+        if len(invalidos):
+            raise ErroIngestao(f"Valores não numéricos em {coluna} encontrados (ex.: {invalidos.iloc[0]!r}). Verifique os dados.")
+        dados[coluna] = convertidos
+    return dados
+
+
+# Função para ler o arquivo inteiro de uma vez (Excel ou CSV, pela extensão do nome)
+def ler_arquivo(arquivo, nome):
+    if _extensao(nome) == "csv":
+        return pd.read_csv(arquivo)
+    return pd.read_excel(arquivo)
+
+
+# Função para ler e validar o arquivo inteiro, sem depender do Streamlit (usada pelo app e pelo modo em lote)
+# Retorna os dados ordenados por Sale_Date e a lista de colunas esperadas que não estão no arquivo
+def carregar_arquivo(arquivo, nome):
+    dados = ler_arquivo(arquivo, nome)
+    if dados.empty:
+        raise ErroIngestao("O arquivo está vazio.")
+    colunas_faltantes = [col for col in COLUNAS_ESPERADAS if col not in dados.columns]
+    if "Sale_Date" in dados.columns:
+        dados["Sale_Date"] = pd.to_datetime(dados["Sale_Date"], errors="coerce")
+        if dados["Sale_Date"].isna().all():
+            raise ErroIngestao("Datas inválidas no arquivo.")
+    dados = _validar_numericas(dados)
+    if "Sales_Amount" in dados.columns and (dados["Sales_Amount"] < 0).any():
+        raise ErroIngestao("Valores negativos em Sales_Amount encontrados. Verifique os dados.")
+    # Tipos compactos (categóricas e inteiros menores) antes de ordenar, para a ordenação já mover menos bytes
+    dados = otimizar_tipos(dados)
+    # Linhas ordenadas por data uma única vez, para os recortes por busca binária
+    return ordenar_por_data(dados), colunas_faltantes
+
+
+# Função para ler um .xlsx em blocos com o openpyxl em modo somente leitura (sem carregar a planilha inteira)
+def blocos_excel(arquivo, tamanho_bloco=TAMANHO_BLOCO):
+    from openpyxl import load_workbook
+
+    livro = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        linhas = livro.worksheets[0].iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        cabecalho = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(cabecalho)]
+        bloco = []
+        for linha in linhas:
+            if all(valor is None for valor in linha):
+                continue
+            bloco.append(linha[:len(cabecalho)])
+            if len(bloco) >= tamanho_bloco:
+                yield pd.DataFrame(bloco, columns=cabecalho)
+                bloco = []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=cabecalho)
+    finally:
+        livro.close()
+
+
+# Função para ler um .csv em blocos
+def blocos_csv(arquivo, tamanho_bloco=TAMANHO_BLOCO):
+    yield from pd.read_csv(arquivo, chunksize=tamanho_bloco)
+
+
+def ler_blocos(arquivo, nome, tamanho_bloco=TAMANHO_BLOCO):
+    if _extensao(nome) == "csv":
+        return blocos_csv(arquivo, tamanho_bloco)
+    return blocos_excel(arquivo, tamanho_bloco)
+
+
+# Função para validar e normalizar um bloco (mesmas regras de carregar_arquivo)
+# colunas: as colunas do primeiro bloco; um bloco sem alguma delas ficaria de fora das somas dessa coluna
+def validar_bloco(bloco, colunas=None):
+    if colunas is not None:
+        faltantes = [c for c in colunas if c not in bloco.columns]
+        if faltantes:
+            raise ErroIngestao(f"Colunas ausentes em parte do arquivo: {faltantes}. Verifique os dados.")
+    if "Sale_Date" in bloco.columns:
+        bloco["Sale_Date"] = pd.to_datetime(bloco["Sale_Date"], errors="coerce")
+    bloco = _validar_numericas(bloco)
+    if "Sales_Amount" in bloco.columns and (bloco["Sales_Amount"] < 0).any():
+        raise ErroIngestao("Valores negativos em Sales_Amount encontrados. Verifique os dados.")
+    return bloco
+
+
+# Função para calcular os KPIs lendo o arquivo em blocos, com memória limitada ao tamanho do bloco
+# Retorna o ParcialKPI acumulado e a lista de colunas esperadas que não estão no arquivo
+def agregar_em_streaming(arquivo, nome, tamanho_bloco=TAMANHO_BLOCO, ao_avancar=None):
+    parcial = ParcialKPI()
+    colunas = None
+    for bloco in ler_blocos(arquivo, nome, tamanho_bloco):
+        parcial.adicionar(validar_bloco(bloco, colunas))
+        colunas = colunas if colunas is not None else bloco.columns.tolist()
+        if ao_avancar is not None:
+            ao_avancar(parcial.linhas)
+    if parcial.linhas == 0:
+        raise ErroIngestao("O arquivo está vazio.")
+    if "Sale_Date" in parcial.colunas and parcial.data_min is None:
+        raise ErroIngestao("Datas inválidas no arquivo.")
+    colunas_faltantes = [col for col in COLUNAS_ESPERADAS if col not in parcial.colunas]
+    return parcial, colunas_faltantes
@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Arquivo de log estruturado (uma linha JSON por etapa); sem a variável, o log não é gravado em arquivo
+ARQUIVO_LOG = os.environ.get("KPI_LOG_ARQUIVO")
+
+logger = logging.getLogger("gerador_kpi")
+
+
+# Função para configurar o log em arquivo uma única vez por processo (o Streamlit reexecuta o script a cada interação)
+def configurar_log(caminho=None, nivel=logging.INFO):
+    caminho = caminho or ARQUIVO_LOG
+    logger.setLevel(nivel)
+    if caminho:
+        caminho = os.path.abspath(caminho)
+        if not any(isinstance(h, logging.FileHandler) and h.baseFilename == caminho for h in logger.handlers):
+            handler = logging.FileHandler(caminho, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+    return logger
+
+
+# Função para registrar um evento estruturado no log
+def registrar_evento(evento, **campos):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"momento": datetime.now().isoformat(timespec="milliseconds"), "evento": evento, **campos}, ensure_ascii=False, default=str))
+
+
+# Função para ler a memória residente do processo em bytes (None se não for possível medir)
+def memoria_residente():
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Sem /proc, usa o pico de memória (ru_maxrss em KB no Linux, bytes no macOS)
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if os.uname().sysname == "Darwin" else pico * 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+class Medidor:
+    """Registra tempo, linhas processadas e variação de memória de cada etapa de uma execução do script."""
+
+    def __init__(self, limite_historico=500):
+        self.execucao = 0
+        self.registros = []
+        self.historico = deque(maxlen=limite_historico)
+
+    # Função para iniciar uma nova execução (chamada no início de cada rerun)
+    def nova_execucao(self):
+        self.execucao += 1
+        self.registros = []
+
+    # Função para medir uma etapa; o registro retornado pode receber campos extras (ex.: linhas, cache)
+    @contextmanager
+    def etapa(self, nome, linhas=None, **campos):
+        registro = {"execucao": self.execucao, "etapa": nome, "linhas": linhas, **campos}
+        memoria_inicial = memoria_residente()
+        inicio = time.perf_counter()
+        try:
+            yield registro
+            registro.setdefault("status", "ok")
+        except BaseException as e:
+            registro["status"] = f"erro: {type(e).__name__}"
+            raise
+        finally:
+            registro["segundos"] = round(time.perf_counter() - inicio, 4)
+            memoria_final = memoria_residente()
+            if memoria_inicial is not None and memoria_final is not None:
+                registro["memoria_delta_mb"] = round((memoria_final - memoria_inicial) / (1024 * 1024), 2)
+                registro["memoria_mb"] = round(memoria_final / (1024 * 1024), 1)
+            self.registros.append(registro)
+            self.historico.append(registro)
+            registrar_evento("etapa", **registro)
@@ -0,0 +1,181 @@
+"""Geração de relatórios de KPIs em lote, sem a interface Streamlit.
+
+Uso:
+    python lote.py dados/regionais/ --saida relatorios/
+    python lote.py "dados/*.xlsx" outro.csv --processos 8 --formatos pdf,csv --streaming
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from agregacao import ParcialKPI
+from exportacao import exportar_csv, exportar_pdf
+from ingestao import EXTENSOES_SUPORTADAS, agregar_em_streaming, carregar_arquivo
+
+FORMATOS_RELATORIO = ["pdf", "csv"]
+KPIS_RESUMO = ["Receita Total", "Custo Total", "Margem de Lucro (%)", "Período Analisado"]
+# Nome já usado pelo relatório consolidado no diretório de saída (consolidado_kpis.pdf/.csv)
+NOMES_RESERVADOS = {"consolidado"}
+
+
+# Função para expandir diretórios e padrões glob na lista de arquivos suportados
+def listar_arquivos(entradas):
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            candidatos = [os.path.join(entrada, f"*.{extensao}") for extensao in EXTENSOES_SUPORTADAS]
+            encontrados = sorted(c for padrao in candidatos for c in glob.glob(padrao))
+        else:
+            encontrados = sorted(glob.glob(entrada)) or [entrada]
+        for arquivo in encontrados:
+            # Arquivos temporários do Excel (~$planilha.xlsx) não são planilhas válidas
+            if os.path.basename(arquivo).startswith("~$"):
+                continue
+            if os.path.splitext(arquivo)[1].lower().lstrip(".") in EXTENSOES_SUPORTADAS and arquivo not in arquivos:
+                arquivos.append(arquivo)
+    return arquivos
+
+
+# Função para dar a cada arquivo um nome de relatório único no diretório de saída
+# O nome é o do arquivo; se ele se repetir (ex.: in/a/jan.xlsx e in/b/jan.csv), entra a extensão e, se ainda
+# assim se repetir, um número no fim
+def nomes_de_saida(arquivos):
+    nomes = {}
+    usados = set(NOMES_RESERVADOS)
+    raizes = Counter(os.path.splitext(os.path.basename(a))[0].lower() for a in arquivos)
+    for arquivo in arquivos:
+        raiz, extensao = os.path.splitext(os.path.basename(arquivo))
+        nome = f"{raiz}_{extensao.lstrip('.')}" if raizes[raiz.lower()] > 1 else raiz
+        candidato, numero = nome, 1
+        # Comparação sem maiúsculas/minúsculas: em alguns sistemas de arquivos Jan e jan são o mesmo arquivo
+        while candidato.lower() in usados:
+            numero += 1
+            candidato = f"{nome}_{numero}"
+        usados.add(candidato.lower())
+        nomes[arquivo] = candidato
+    return nomes
+
+
+def _gravar(buffer, caminho):
+    buffer.seek(0)
+    with open(caminho, "wb") as destino:
+        shutil.copyfileobj(buffer, destino)
+    buffer.close()
+
+
+# Função executada em cada processo: lê, calcula os KPIs e grava os relatórios de um arquivo
+# Retorna os tempos por etapa, os relatórios gravados e o ParcialKPI, usado no resumo consolidado
+def processar_arquivo(caminho, diretorio_saida, formatos, streaming=False, nome_saida=None):
+    resultado = {"arquivo": caminho, "status": "ok", "erro": None, "linhas": 0, "tempos": {}, "parcial": None, "kpis": {}, "relatorios": []}
+    inicio = time.perf_counter()
+    try:
+        etapa = time.perf_counter()
+        if streaming:
+            parcial, colunas_faltantes = agregar_em_streaming(caminho, caminho)
+        else:
+            dados, colunas_faltantes = carregar_arquivo(caminho, caminho)
+            resultado["tempos"]["leitura"] = time.perf_counter() - etapa
+            etapa = time.perf_counter()
+            parcial = ParcialKPI.de_dados(dados)
+            del dados
+        kpis = parcial.kpis()
+        resultado["tempos"]["kpis" if not streaming else "leitura_e_kpis"] = time.perf_counter() - etapa
+        resultado["colunas_faltantes"] = colunas_faltantes
+
+        nome_saida = nome_saida or os.path.splitext(os.path.basename(caminho))[0]
+        base = os.path.join(diretorio_saida, nome_saida + "_kpis")
+        etapa = time.perf_counter()
+        if "pdf" in formatos:
+            _gravar(exportar_pdf(kpis), base + ".pdf")
+            resultado["relatorios"].append(base + ".pdf")
+        if "csv" in formatos:
+            _gravar(exportar_csv(kpis), base + ".csv")
+            resultado["relatorios"].append(base + ".csv")
+        resultado["tempos"]["exportacao"] = time.perf_counter() - etapa
+
+        resultado.update(linhas=parcial.linhas, parcial=parcial, kpis=kpis)
+    except Exception as e:
+        resultado.update(status="erro", erro=f"{type(e).__name__}: {e}")
+    resultado["tempos"]["total"] = time.perf_counter() - inicio
+    return resultado
+
+
+# Função para montar a tabela de resumo (uma linha por arquivo)
+def tabela_resumo(resultados):
+    linhas = []
+    for r in resultados:
+        linha = {"Arquivo": r["arquivo"], "Status": r["status"], "Erro": r["erro"], "Linhas": r["linhas"], "Relatórios": "; ".join(r["relatorios"])}
+        for kpi in KPIS_RESUMO:
+            linha[kpi] = r["kpis"].get(kpi)
+        for etapa, segundos in r["tempos"].items():
+            linha[f"Tempo {etapa} (s)"] = round(segundos, 3)
+        linhas.append(linha)
+    return pd.DataFrame(linhas)
+
+
+# Função para processar todos os arquivos em paralelo e gravar relatórios individuais e consolidados
+def gerar_relatorios(arquivos, diretorio_saida, formatos=FORMATOS_RELATORIO, processos=None, streaming=False, saida=sys.stdout):
+    os.makedirs(diretorio_saida, exist_ok=True)
+    processos = min(processos or os.cpu_count() or 1, max(len(arquivos), 1))
+    inicio = time.perf_counter()
+    resultados = []
+    nomes = nomes_de_saida(arquivos)
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = [executor.submit(processar_arquivo, arquivo, diretorio_saida, formatos, streaming, nomes[arquivo]) for arquivo in arquivos]
+        for futuro in as_completed(futuros):
+            r = futuro.result()
+            resultados.append(r)
+            detalhe = f"{r['linhas']} linhas" if r["status"] == "ok" else r["erro"]
+            print(f"[{len(resultados)}/{len(arquivos)}] {r['arquivo']}: {r['status']} em {r['tempos']['total']:.2f}s ({detalhe})", file=saida)
+    resultados.sort(key=lambda r: arquivos.index(r["arquivo"]))
+
+    # Consolidado: os agregados parciais de todos os arquivos são combinados, sem reler os dados
+    consolidado = ParcialKPI()
+    for r in resultados:
+        if r["parcial"] is not None:
+            consolidado.combinar(r["parcial"])
+    kpis_consolidados = consolidado.kpis()
+    if kpis_consolidados:
+        base = os.path.join(diretorio_saida, "consolidado_kpis")
+        if "pdf" in formatos:
+            _gravar(exportar_pdf(kpis_consolidados), base + ".pdf")
+        if "csv" in formatos:
+            _gravar(exportar_csv(kpis_consolidados), base + ".csv")
+    tabela_resumo(resultados).to_csv(os.path.join(diretorio_saida, "resumo.csv"), index=False)
+
+    total = time.perf_counter() - inicio
+    erros = sum(r["status"] != "ok" for r in resultados)
+    print(f"{len(resultados)} arquivos processados em {total:.2f}s com {processos} processos ({erros} com erro). Relatórios em {diretorio_saida}", file=saida)
+    return resultados, kpis_consolidados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera relatórios de KPIs para vários arquivos Excel/CSV em paralelo.")
+    parser.add_argument("entradas", nargs="+", help="Arquivos, diretórios ou padrões glob (ex.: 'dados/*.xlsx')")
+    parser.add_argument("--saida", default="relatorios", help="Diretório onde os relatórios são gravados (padrão: relatorios)")
+    parser.add_argument("--processos", type=int, default=None, help="Número de processos (padrão: todos os núcleos)")
+    parser.add_argument("--formatos", default=",".join(FORMATOS_RELATORIO), help="Formatos dos relatórios por arquivo, separados por vírgula (pdf,csv)")
+    parser.add_argument("--streaming", action="store_true", help="Lê os arquivos em blocos, com memória limitada")
+    args = parser.parse_args(argv)
+
+    formatos = [f.strip().lower() for f in args.formatos.split(",") if f.strip()]
+    desconhecidos = [f for f in formatos if f not in FORMATOS_RELATORIO]
+    if desconhecidos:
+        parser.error(f"Formatos desconhecidos: {desconhecidos}. Use {FORMATOS_RELATORIO}.")
+    arquivos = listar_arquivos(args.entradas)
+    if not arquivos:
+        parser.error("Nenhum arquivo .xlsx ou .csv encontrado nas entradas informadas.")
+
+    resultados, _ = gerar_relatorios(arquivos, args.saida, formatos, args.processos, args.streaming)
+    return 1 if any(r["status"] != "ok" for r in resultados) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,48 +1,43 @@
+import os
+import uuid
 import streamlit as st
 import streamlit_authenticator as stauth
 import yaml
-from yaml.loader import SafeLoader
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime
-from io import BytesIO
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
+from credenciais import carregar_config
+from instrumentacao import Medidor, configurar_log
+
+# Antes do login só são importados os módulos leves; pandas, gráficos, exportação e ingestão
+# são importados depois da autenticação (ver o bloco "elif authentication_status")
+
+# Log estruturado em arquivo (variável de ambiente KPI_LOG_ARQUIVO)
+configurar_log()
 
 # Inicializar authenticator como None
 authenticator = None
 
-# Carregar credenciais do arquivo YAML com tratamento detalhado de erros e depuração
+# Carregar credenciais do arquivo YAML com tratamento detalhado de erros
+# O YAML é lido uma vez por processo (e relido só se o arquivo mudar); o autenticador é criado
+# uma vez por sessão, pois guarda o estado do componente de cookie de cada usuário
 try:
-    import os
-    print(f"Checando arquivo credentials.yaml em: {os.path.abspath('credentials.yaml')}")
     if not os.path.exists('credentials.yaml'):
         st.error("Arquivo credentials.yaml não encontrado. Crie o arquivo com credenciais válidas no diretório atual.")
         st.stop()
 
-    with open('credentials.yaml', 'r', encoding='utf-8') as file:
-        config = yaml.load(file, Loader=SafeLoader)
-    print("Configuração carregada:", config)  # Depuração para verificar o conteúdo
+    config = carregar_config('credentials.yaml')
 
     if not config or 'credentials' not in config or 'usernames' not in config['credentials']:
         st.error("O arquivo credentials.yaml está vazio, mal formatado, ou não contém a chave 'usernames'. Verifique a estrutura.")
         st.stop()
 
-    # Adicionar depuração para verificar os usernames antes de criar o authenticator
-    config['credentials']
-    print("Usuários carregados:")
-
-    authenticator = stauth.Authenticate(
-    config['credentials'],  # Pass the entire 'credentials' dictionary
-    cookie_name=config['cookie']['name'],
-    cookie_key=config['cookie']['key'],
-    cookie_expiry_days=config['cookie']['expiry_days']
-)
-    print("Authenticator criado com sucesso:", authenticator)
+    if st.session_state.get("authenticator_config") is not config:
+        st.session_state["authenticator"] = stauth.Authenticate(
+        config['credentials'],  # Pass the entire 'credentials' dictionary
+        cookie_name=config['cookie']['name'],
+        cookie_key=config['cookie']['key'],
+        cookie_expiry_days=config['cookie']['expiry_days']
+    )
+        st.session_state["authenticator_config"] = config
+    authenticator = st.session_state["authenticator"]
 except FileNotFoundError:
     st.error("Arquivo credentials.yaml não encontrado. Crie o arquivo com credenciais válidas no diretório atual.")
     st.stop()
@@ -69,292 +64,446 @@ if authentication_status == False:
 elif authentication_status == None:
     st.warning("Por favor, insira seu usuário e senha")
 elif authentication_status:
+    import pandas as pd
+    from datetime import datetime
+    from io import BytesIO
+    from cache_dados import hash_conteudo, cache_do_escopo, dataset_da_chave, CACHE_COMPARTILHADO
+    from armazenamento import listar_datasets, salvar_dataset, carregar_dataset
+    from agregacao import ParcialKPI
+    from consultas import MotorConsultas, ErroConsulta
+    from catalogo import ErroCatalogo, anexar_ao_dataset, parcial_dataset
+    from cubo import CuboKPI
+    from exportacao import exportar_pdf, exportar_csv, exportar_excel
+    from graficos import criar_graficos, grafico_vendas_dimensao, grafico_em_cache, grafico_guardado
+    from indice import IndiceDados, ordenar_por_data
+    from ingestao import EXTENSOES_SUPORTADAS, ErroIngestao, carregar_arquivo, agregar_em_streaming
+    from tarefas import EXECUTOR_TAREFAS, CONCLUIDA, ERRO
+
     st.write(f"Bem-vindo, {name}!")
     authenticator.logout("Logout", "sidebar")
+
+    # Medição de tempo e memória das etapas desta execução do script
+    if "medidor" not in st.session_state:
+        st.session_state["medidor"] = Medidor()
+    medidor = st.session_state["medidor"]
+    medidor.nova_execucao()
+    # Administradores (chave 'admins' do credentials.yaml ou variável KPI_ADMINS) veem o painel de desempenho
+    administradores = set(config.get('admins') or []) | {u.strip() for u in os.environ.get("KPI_ADMINS", "").split(",") if u.strip()}
+    usuario = st.session_state.get("username")
+    eh_admin = usuario in administradores
+    # Identifica esta sessão nas tarefas em segundo plano, que podem ser aguardadas por várias sessões
+    id_sessao = st.session_state.setdefault("id_sessao", uuid.uuid4().hex)
+
+    # Cache compartilhado entre as sessões, mas cada usuário só enxerga os datasets que carregou ou abriu
+    def obter_cache():
+        return cache_do_escopo(st.session_state, usuario=usuario)
     
-    # ... (o resto do código, incluindo funções processar_dados, calcular_kpis, criar_graficos, etc., permanece o mesmo)
-    # Função para carregar e processar o arquivo Excel
-    def processar_dados(arquivo):
-        try:
-            dados = pd.read_excel(arquivo)
-            if dados.empty:
-                st.error("O arquivo Excel está vazio.")
-                return None
-            # Validação de colunas esperadas
-            colunas_esperadas = ["Product_ID", "Sale_Date", "Sales_Rep_Region", "Sales_Amount", "Quantity_Sold", "Product_Category", "Unit_Cost", "Unit_Price", "Customer_Type", "Discount", "Payment_Method", "Sales_Channel", "Region_and_Sales_Rep"]
-            colunas_faltantes = [col for col in colunas_esperadas if col not in dados.columns]
-            if colunas_faltantes:
-                st.warning(f"Colunas ausentes: {colunas_faltantes}. Algumas funcionalidades podem não estar disponíveis.")
-            # Validação de dados
-            if "Sale_Date" in dados.columns:
-                dados["Sale_Date"] = pd.to_datetime(dados["Sale_Date"], errors="coerce")
-                if dados["Sale_Date"].isna().all():
-                    st.error("Datas inválidas no arquivo Excel.")
-                    return None
-            if "Sales_Amount" in dados.columns and (dados["Sales_Amount"] < 0).any():
-                st.error("Valores negativos em Sales_Amount encontrados. Verifique os dados.")
-                return None
-            return dados
-        except Exception as e:
-            st.error(f"Erro ao carregar o arquivo: {e}")
+    # Tarefas em segundo plano já exibidas nesta execução (a mesma tarefa pode ser pedida em mais de um ponto da página)
+    tarefas_exibidas = set()
+
+    # Função para acompanhar uma tarefa em segundo plano: o progresso é atualizado a cada segundo sem reexecutar
+    # a página inteira, e a página é reexecutada quando a tarefa termina, para o resultado aparecer
+    @st.fragment(run_every=1)
+    def acompanhar_tarefa(chave, id_tarefa):
+        tarefa = EXECUTOR_TAREFAS.obter(chave, sessao=id_sessao)
+        if tarefa is None or tarefa.terminada or tarefa.desistiu(id_sessao):
+            st.rerun()
+        texto = tarefa.descricao + (f": {tarefa.mensagem}" if tarefa.mensagem else "") + f" ({tarefa.segundos:.0f}s)"
+        if tarefa.progresso is None:
+            st.info(texto)
+        else:
+            st.progress(tarefa.progresso, text=texto)
+        if st.button("Cancelar", key=f"cancelar_{id_tarefa}"):
+            # Se outra sessão aguarda o mesmo resultado, a tarefa continua para ela
+            EXECUTOR_TAREFAS.cancelar(chave, sessao=id_sessao)
+            st.rerun()
+
+    # Função para exibir o estado de uma tarefa; devolve o resultado se ela já terminou, senão None
+    def resultado_da_tarefa(tarefa):
+        id_tarefa = hash_conteudo(repr(tarefa.chave).encode("utf-8"))[:16]
+        exibida = id_tarefa in tarefas_exibidas
+        tarefas_exibidas.add(id_tarefa)
+        desistiu = tarefa.desistiu(id_sessao)
+        if tarefa.estado == CONCLUIDA and not desistiu:
+            if not exibida:
+                for aviso in tarefa.avisos:
+                    st.warning(aviso)
+            return tarefa.resultado
+        if exibida:
             return None
-
-    # Função para calcular KPIs
-    def calcular_kpis(dados):
-        if dados is None or dados.empty:
-            return {}
-        
-        kpis = {}
-        colunas = dados.columns.tolist()
-        tipos = dados.dtypes.to_dict()
-
-        def eh_numerico(col): return np.issubdtype(tipos[col], np.number)
-        def eh_data(col): return "date" in col.lower() or pd.api.types.is_datetime64_any_dtype(dados[col])
-
-        for coluna in colunas:
-            if eh_numerico(coluna) and not dados[coluna].isna().all():
-                kpis[f"Total {coluna}"] = dados[coluna].sum()
-                kpis[f"Média {coluna}"] = dados[coluna].mean()
-                kpis[f"Máximo {coluna}"] = dados[coluna].max()
-                kpis[f"Mínimo {coluna}"] = dados[coluna].min()
-
-        if eh_data("Sale_Date") and not dados["Sale_Date"].isna().all():
-            kpis["Período Analisado"] = f"{dados['Sale_Date'].min().strftime('%d/%m/%Y')} a {dados['Sale_Date'].max().strftime('%d/%m/%Y')}"
-            kpis["Dias Totais"] = (dados["Sale_Date"].max() - dados["Sale_Date"].min()).days + 1
-
-        if "Sales_Amount" in colunas and "Unit_Cost" in colunas and not dados[["Sales_Amount", "Unit_Cost", "Quantity_Sold"]].isna().all().any():
-            kpis["Receita Total"] = dados["Sales_Amount"].sum() if not dados["Sales_Amount"].isna().all() else 0
-            kpis["Custo Total"] = (dados["Unit_Cost"].sum() * dados["Quantity_Sold"].sum()) if not dados[["Unit_Cost", "Quantity_Sold"]].isna().all().any() else 0
-            if kpis["Receita Total"] > 0:
-                kpis["Margem de Lucro (%)"] = ((kpis["Receita Total"] - kpis["Custo Total"]) / kpis["Receita Total"]) * 100
-
-        if "Sales_Amount" in colunas and "Product_Category" in colunas and not dados[["Sales_Amount", "Product_Category"]].isna().all().any():
-            kpis["Vendas por Categoria"] = dados.groupby("Product_Category")["Sales_Amount"].sum().dropna().to_dict()
-            kpis["Lucro por Categoria"] = (dados.groupby("Product_Category")["Sales_Amount"].sum() - dados.groupby("Product_Category")["Unit_Cost"].sum() * dados.groupby("Product_Category")["Quantity_Sold"].sum()).dropna().to_dict()
-
-        if "Sales_Amount" in colunas and "Sales_Channel" in colunas and not dados[["Sales_Amount", "Sales_Channel"]].isna().all().any():
-            kpis["Vendas por Canal"] = dados.groupby("Sales_Channel")["Sales_Amount"].sum().dropna().to_dict()
-            kpis["Lucro por Canal"] = (dados.groupby("Sales_Channel")["Sales_Amount"].sum() - dados.groupby("Sales_Channel")["Unit_Cost"].sum() * dados.groupby("Sales_Channel")["Quantity_Sold"].sum()).dropna().to_dict()
-
-        if "Sales_Amount" in colunas and "Region_and_Sales_Rep" in colunas and not dados[["Sales_Amount", "Region_and_Sales_Rep"]].isna().all().any():
-            kpis["Vendas por Região/Representante"] = dados.groupby("Region_and_Sales_Rep")["Sales_Amount"].sum().dropna().to_dict()
-            kpis["Lucro por Região/Representante"] = (dados.groupby("Region_and_Sales_Rep")["Sales_Amount"].sum() - dados.groupby("Region_and_Sales_Rep")["Unit_Cost"].sum() * dados.groupby("Region_and_Sales_Rep")["Quantity_Sold"].sum()).dropna().to_dict()
-
-        if "Sales_Amount" in colunas and "Sale_Date" in colunas:
-            dados["Sale_Date"] = pd.to_datetime(dados["Sale_Date"], errors="coerce")
-            vendas_mensais = dados.groupby(dados["Sale_Date"].dt.to_period('M'))["Sales_Amount"].sum().dropna()
-            if not vendas_mensais.empty:
-                kpis["Crescimento de Vendas Mensal (%)"] = ((vendas_mensais / vendas_mensais.shift(1) - 1) * 100).dropna().to_dict()
-
-        if "Customer_Type" in colunas and "Sales_Amount" in colunas:
-            kpis["Ticket Médio por Tipo de Cliente"] = dados.groupby("Customer_Type")["Sales_Amount"].mean().dropna().to_dict()
-
-        return kpis
-
-    # Função para criar gráficos
-    def criar_graficos(dados):
-        if dados is None or dados.empty:
+        if not tarefa.terminada and not desistiu:
+            acompanhar_tarefa(tarefa.chave, id_tarefa)
             return None
-        
-        fig, axes = plt.subplots(2, 2, figsize=(12, 10))
-        fig.suptitle("Relatórios Visuais de KPIs", fontsize=16)
-
-        ax1, ax2, ax3, ax4 = axes[0, 0], axes[0, 1], axes[1, 0], axes[1, 1]
-
-        # Gráfico 1: Vendas por Categoria (Gráfico de Barras)
-        if "Product_Category" in dados.columns and "Sales_Amount" in dados.columns:
-            vendas_categoria = dados.groupby("Product_Category")["Sales_Amount"].sum().dropna()
-            if not vendas_categoria.empty:
-                sns.barplot(x=vendas_categoria.index, y=vendas_categoria.values, ax=ax1, palette="Blues_d")
-                ax1.set_title("Vendas por Categoria")
-                ax1.set_xlabel("Categoria")
-                ax1.set_ylabel("Valor (R$)")
-                ax1.tick_params(axis='x', rotation=45)
-            else:
-                ax1.text(0.5, 0.5, "Sem dados disponíveis", ha='center', va='center')
-
-        # Gráfico 2: Vendas por Canal (Gráfico de Pizza)
-        if "Sales_Channel" in dados.columns and "Sales_Amount" in dados.columns:
-            vendas_canal = dados.groupby("Sales_Channel")["Sales_Amount"].sum().dropna()
-            if not vendas_canal.empty:
-                vendas_canal.plot(kind="pie", ax=ax2, autopct='%1.1f%%', colors=['#FF6B6B', '#4ECDC4', '#45B7D1'])
-                ax2.set_title("Vendas por Canal")
-            else:
-                ax2.text(0.5, 0.5, "Sem dados disponíveis", ha='center', va='center')
-
-        # Gráfico 3: Vendas por Região/Representante (Gráfico de Linhas)
-        if "Region_and_Sales_Rep" in dados.columns and "Sales_Amount" in dados.columns:
-            vendas_regiao = dados.groupby("Region_and_Sales_Rep")["Sales_Amount"].sum().dropna()
-            if not vendas_regiao.empty:
-                vendas_regiao.plot(kind="line", ax=ax3, marker='o', color='#FFA500', linewidth=2)
-                ax3.set_title("Vendas por Região/Representante")
-                ax3.set_xlabel("Região/Representante")
-                ax3.set_ylabel("Valor (R$)")
-                ax3.tick_params(axis='x', rotation=45)
+        if tarefa.estado == ERRO and not desistiu:
+            st.error(str(tarefa.erro) if isinstance(tarefa.erro, ErroIngestao) else f"Erro em {tarefa.descricao.lower()}: {tarefa.erro}")
+        else:
+            st.info(f"{tarefa.descricao}: cancelada.")
+        if st.button("Tentar novamente", key=f"repetir_{id_tarefa}"):
+            # Quem desistiu de uma tarefa que continuou para outras sessões volta a aguardá-la
+            if desistiu:
+                EXECUTOR_TAREFAS.retomar(tarefa.chave, id_sessao)
             else:
-                ax3.text(0.5, 0.5, "Sem dados disponíveis", ha='center', va='center')
-
-        # Gráfico 4: Vendas ao Longo do Tempo (Gráfico de Linhas)
-        if "Sale_Date" in dados.columns and "Sales_Amount" in dados.columns:
-            dados["Sale_Date"] = pd.to_datetime(dados["Sale_Date"], errors="coerce")
-            vendas_tempo = dados.groupby("Sale_Date")["Sales_Amount"].sum().dropna()
-            if not vendas_tempo.empty:
-                vendas_tempo.plot(kind="line", ax=ax4, marker='o', color='#2E8B57', linewidth=2)
-                ax4.set_title("Vendas ao Longo do Tempo")
-                ax4.set_xlabel("Data")
-                ax4.set_ylabel("Valor (R$)")
+                EXECUTOR_TAREFAS.descartar(tarefa.chave)
+            st.rerun()
+        return None
+
+    # Função para executar um trabalho pesado em segundo plano, funcao(tarefa, *args), que não chama o Streamlit
+    # e guarda o valor no cache (dados lidos, KPIs, cubo, gráficos); obter_valor() lê o valor do cache.
+    # Pedidos iguais (mesma chave) reaproveitam a tarefa em andamento; o resultado é buscado numa próxima execução.
+    # A tarefa não retém o valor: terminada, ele é lido do cache, que continua controlando memória e validade.
+    # Se o valor já saiu do cache, a tarefa terminada é descartada e refeita. Um valor maior que o cache inteiro
+    # volta pela tarefa uma única vez e fica só nesta sessão, apenas para o dataset de origem mais recente.
+    # A chave da tarefa começa pelo dataset de origem, como as chaves do cache.
+    def em_segundo_plano(obter_valor, chave, descricao, funcao, *args):
+        fora_do_cache = st.session_state.setdefault("fora_do_cache", {})
+        valor = obter_valor()
+        if valor is None:
+            valor = fora_do_cache.get(chave)
+        tarefa = EXECUTOR_TAREFAS.obter(chave)
+        if valor is not None:
+            # Os avisos (ex.: colunas ausentes) continuam visíveis enquanto a tarefa terminada for lembrada
+            if tarefa is not None and tarefa.estado == CONCLUIDA and not tarefa.desistiu(id_sessao):
+                resultado_da_tarefa(tarefa)
+            return valor
+        if tarefa is not None and tarefa.estado == CONCLUIDA and tarefa.resultado is None:
+            EXECUTOR_TAREFAS.descartar(chave)
+        tarefa = EXECUTOR_TAREFAS.submeter(chave, funcao, *args, descricao=descricao, sessao=id_sessao)
+        valor = resultado_da_tarefa(tarefa)
+        if tarefa.estado == CONCLUIDA and not tarefa.desistiu(id_sessao):
+            if valor is not None:
+                origem = dataset_da_chave(chave)
+                for outra in [k for k in fora_do_cache if dataset_da_chave(k) != origem]:
+                    del fora_do_cache[outra]
+                fora_do_cache[chave] = valor
+                EXECUTOR_TAREFAS.descartar(chave)
             else:
-                ax4.text(0.5, 0.5, "Sem dados disponíveis", ha='center', va='center')
-
-        plt.tight_layout()
-        return fig
-
-    # Função para exportar para PDF
-    def exportar_pdf(kpis, filename="relatorio_kpis.pdf"):
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-        styles = getSampleStyleSheet()
-        title = Paragraph("Relatório de KPIs", styles['Heading1'])
-        elements.append(title)
-        elements.append(Paragraph(f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
-
-        data = [["KPI", "Valor"]]
-        for kpi, valor in kpis.items():
-            if isinstance(valor, (int, float)):
-                data.append([kpi, f"{valor:.2f}"])
-            else:
-                data.append([kpi, str(valor)])
-        
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
-        doc.build(elements)
-        buffer.seek(0)
-        return buffer
-
-    # Função para exportar para CSV
-    def exportar_csv(kpis, filename="relatorio_kpis.csv"):
-        df_kpis = pd.DataFrame(list(kpis.items()), columns=["KPI", "Valor"])
-        buffer = BytesIO()
-        df_kpis.to_csv(buffer, index=False)
-        buffer.seek(0)
-        return buffer
+                valor = obter_valor()
+        return valor
+
+    # Trabalho em segundo plano: lê e valida o arquivo e guarda o DataFrame no cache
+    def ler_arquivo_para_cache(tarefa, cache, chave, conteudo, nome):
+        tarefa.avancar(mensagem="lendo e validando o arquivo")
+        with medidor.etapa("leitura", arquivo=nome) as registro:
+            dados, colunas_faltantes = carregar_arquivo(BytesIO(conteudo), nome)
+            registro["linhas"] = len(dados)
+            if "memoria_bytes" in dados.attrs:
+                registro["dados_mb_antes"] = round(dados.attrs["memoria_bytes"]["antes"] / (1024 * 1024), 2)
+                registro["dados_mb_depois"] = round(dados.attrs["memoria_bytes"]["depois"] / (1024 * 1024), 2)
+        tarefa.verificar_cancelamento()
+        if colunas_faltantes:
+            tarefa.avisar(f"Colunas ausentes: {colunas_faltantes}. Algumas funcionalidades podem não estar disponíveis.")
+        dados.attrs["chave_cache"] = chave
+        # O resultado fica só no cache; a tarefa devolve o valor apenas se ele não couber no cache
+        return None if cache.guardar(chave, dados) else dados
+
+    # Função para obter o hash do conteúdo do arquivo enviado, calculado uma única vez por upload (file_id),
+    # e não a cada reexecução da página
+    def hash_do_arquivo(arquivo):
+        guardado = st.session_state.get("hash_upload")
+        if guardado is None or guardado[0] != arquivo.file_id:
+            guardado = (arquivo.file_id, hash_conteudo(arquivo.getvalue()))
+            st.session_state["hash_upload"] = guardado
+        return guardado[1]
+
+    # Função para carregar o arquivo usando o cache indexado pelo hash do conteúdo
+    # Enquanto a leitura roda em segundo plano, devolve None e exibe o progresso
+    def carregar_dados(arquivo):
+        conteudo = arquivo.getvalue()
+        chave = hash_do_arquivo(arquivo)
+        cache = obter_cache()
+        # Quem envia o conteúdo tem acesso ao que já foi calculado para ele, inclusive por outros usuários
+        cache.liberar(chave)
+        return em_segundo_plano(lambda: cache.obter(chave), (chave, "leitura"), f"Leitura de {arquivo.name}", ler_arquivo_para_cache, cache, chave, conteudo, arquivo.name)
+
+    # Função para abrir um dataset salvo em formato colunar, também guardado no cache
+    def abrir_dataset_salvo(nome, colunas=None, criado_em=None):
+        origem = f"dataset:{nome}:{criado_em}"
+        chave = (origem, "dados", tuple(colunas) if colunas is not None else None)
+        cache = obter_cache()
+        cache.liberar(origem)
+        dados = cache.obter(chave)
+        if dados is None:
+            try:
+                with medidor.etapa("leitura_dataset", dataset=nome) as registro:
+                    dados = ordenar_por_data(carregar_dataset(nome, colunas))
+                    registro["linhas"] = len(dados)
+            except Exception as e:
+                st.error(f"Erro ao abrir o dataset salvo: {e}")
+                return None
+            dados.attrs["chave_cache"] = chave
+            cache.guardar(chave, dados)
+        return dados
+
+    # Trabalho em segundo plano: KPIs lendo o arquivo em blocos, com o progresso a cada bloco
+    def kpis_streaming_para_cache(tarefa, cache, chave, conteudo, nome):
+        buffer = BytesIO(conteudo)
+        # No CSV a posição no arquivo estima o progresso; no .xlsx (compactado) só as linhas lidas são informadas
+        eh_csv = nome.lower().endswith(".csv")
+
+        def ao_avancar(linhas):
+            tarefa.avancar(buffer.tell() / max(len(conteudo), 1) if eh_csv else None, f"{linhas} linhas lidas")
+
+        with medidor.etapa("leitura_streaming", arquivo=nome) as registro:
+            parcial, colunas_faltantes = agregar_em_streaming(buffer, nome, ao_avancar=ao_avancar)
+            registro["linhas"] = parcial.linhas
+        if colunas_faltantes:
+            tarefa.avisar(f"Colunas ausentes: {colunas_faltantes}. Algumas funcionalidades podem não estar disponíveis.")
+        kpis = parcial.kpis()
+        return None if cache.guardar(chave, kpis) else kpis
+
+    # Função para calcular os KPIs lendo o arquivo em blocos, sem carregar a planilha inteira na memória
+    def calcular_kpis_streaming(arquivo):
+        origem = hash_do_arquivo(arquivo)
+        chave = (origem, "kpis_streaming")
+        cache = obter_cache()
+        cache.liberar(origem)
+        kpis = em_segundo_plano(lambda: cache.obter(chave), chave, f"Leitura em blocos de {arquivo.name}", kpis_streaming_para_cache, cache, chave, arquivo.getvalue(), arquivo.name)
+        return kpis or {}
+
+    # Trabalho em segundo plano: monta um valor derivado do dataset e o guarda no cache
+    def montar_para_cache(tarefa, cache, chave, montar, etapa, linhas):
+        with medidor.etapa(etapa, linhas=linhas):
+            valor = montar()
+        tarefa.verificar_cancelamento()
+        return None if cache.guardar(chave, valor) else valor
+
+    # Função para obter um valor derivado do dataset (cubo, índice, KPIs) do cache, montando só na primeira vez
+    # A chave começa pelo dataset de origem, que define quem tem acesso ao valor
+    # Com descricao, a montagem roda em segundo plano e a função devolve None até ela terminar
+    def obter_derivado(dados, tipo, montar, *parametros, descricao=None):
+        chave = dados.attrs.get("chave_cache")
+        if chave is None:
+            return montar()
+        cache = obter_cache()
+        chave_derivada = (dataset_da_chave(chave), tipo, chave) + parametros
+        if descricao is not None:
+            return em_segundo_plano(lambda: cache.obter(chave_derivada), chave_derivada, descricao, montar_para_cache, cache, chave_derivada, montar, tipo, len(dados))
+        valor = cache.obter(chave_derivada)
+        if valor is None:
+            valor = montar()
+            cache.guardar(chave_derivada, valor)
+        return valor
+
+    # Função para obter o cubo de agregados usado pelos filtros, montado uma vez por dataset (em segundo plano)
+    def obter_cubo(dados):
+        return obter_derivado(dados, "cubo", lambda: CuboKPI(dados), descricao="Montagem do cubo de filtros")
+
+    # Função para obter o índice de datas e filtros do dataset, montado uma vez por dataset
+    def obter_indice(dados):
+        return obter_derivado(dados, "indice", lambda: IndiceDados(dados))
+
+    # Função para obter o motor de consultas do chat, montado uma vez por dataset (em segundo plano)
+    def obter_consultas(dados):
+        return obter_derivado(dados, "consultas", lambda: MotorConsultas(dados), descricao="Preparação das consultas do chat")
+
+    # Trabalho em segundo plano: renderiza o painel de gráficos e guarda a imagem no cache de gráficos
+    def renderizar_painel(tarefa, dados, serie):
+        tarefa.avancar(mensagem="desenhando os gráficos")
+        chave = (dados.attrs.get("chave_cache"), None, "painel")
+        with medidor.etapa("graficos", linhas=len(dados)):
+            imagem = grafico_em_cache(chave, lambda: criar_graficos(dados, serie))
+        return None if grafico_guardado(chave) is not None else imagem
+
+    # Trabalhos em segundo plano das exportações: devolvem os bytes do arquivo pronto
+    def gerar_pdf(tarefa, kpis, imagens):
+        tarefa.avancar(mensagem="montando o PDF")
+        with medidor.etapa("exportacao_pdf", linhas=len(kpis)):
+            with exportar_pdf(kpis, imagens=imagens) as pdf_buffer:
+                return pdf_buffer.read()
+
+    def gerar_excel(tarefa, kpis, obter_linhas):
+        linhas_exportadas = None
+        if obter_linhas is not None:
+            tarefa.avancar(mensagem="separando as linhas filtradas")
+            linhas_exportadas = obter_linhas()
+        tarefa.avancar(mensagem="gravando as abas")
+        with medidor.etapa("exportacao_excel", linhas=len(linhas_exportadas) if linhas_exportadas is not None else None):
+            ao_avancar = lambda gravadas, total: tarefa.avancar(gravadas / total, f"{gravadas} de {total} linhas gravadas")
+            with exportar_excel(kpis, dados=linhas_exportadas, ao_avancar=ao_avancar) as output:
+                return output.read()
+
+    # Função para oferecer o download de uma exportação em segundo plano, se ela for dos KPIs exibidos agora
+    def baixar_exportacao(exportacoes, formato, rotulo, nome_arquivo, mime):
+        chave = exportacoes.get(formato)
+        tarefa = EXECUTOR_TAREFAS.obter(chave, sessao=id_sessao) if chave is not None else None
+        if tarefa is None or chave[0] != chave_relatorio:
+            exportacoes.pop(formato, None)
+            return
+        conteudo = resultado_da_tarefa(tarefa)
+        if conteudo is not None and st.download_button(label=rotulo, data=conteudo, file_name=nome_arquivo, mime=mime, key=f"baixar_{formato}"):
+            # Arquivo entregue: a tarefa é descartada para liberar os bytes, a menos que outra sessão
+            # do mesmo usuário ainda aguarde o mesmo arquivo
+            EXECUTOR_TAREFAS.descartar(chave, sessao=id_sessao)
+            exportacoes.pop(formato, None)
+
+    # Função para exibir os KPIs em duas colunas
+    def exibir_kpis(kpis):
+        st.subheader("KPIs Calculados")
+        col1, col2 = st.columns(2)
+        with col1:
+            for kpi, valor in list(kpis.items())[:len(kpis)//2]:
+                if isinstance(valor, (int, float)):
+                    st.write(f"**{kpi}:** {valor:.2f}")
+                else:
+                    st.write(f"**{kpi}:** {valor}")
+        with col2:
+            for kpi, valor in list(kpis.items())[len(kpis)//2:]:
+                if isinstance(valor, (int, float)):
+                    st.write(f"**{kpi}:** {valor:.2f}")
+                else:
+                    st.write(f"**{kpi}:** {valor}")
 
     # Interface Streamlit
     st.title("Gerador de Relatórios de KPIs com Gráficos")
-    st.write("Carregue um arquivo Excel para gerar relatórios e visualizar dados.")
+    st.write("Carregue um arquivo Excel ou CSV para gerar relatórios e visualizar dados.")
 
     # Upload de arquivo com feedback
     with st.container():
         st.subheader("Upload de Arquivo")
-        arquivo = st.file_uploader("Carregue o arquivo Excel (.xlsx)", type=["xlsx"], help="Selecione um arquivo Excel com dados de vendas, custos, etc.")
+        arquivo = st.file_uploader("Carregue o arquivo Excel (.xlsx) ou CSV", type=EXTENSOES_SUPORTADAS, help="Selecione um arquivo Excel ou CSV com dados de vendas, custos, etc.")
+        modo_streaming = st.checkbox("Modo streaming (arquivos grandes)", help="Lê o arquivo em blocos e calcula só os KPIs, sem carregar todos os dados na memória. Gráficos, filtros e chat ficam indisponíveis.")
         if st.button("Processar Arquivo", type="primary"):
-            with st.spinner("Processando o arquivo..."):
-                dados = processar_dados(arquivo)
-                if dados is not None:
-                    st.success("Arquivo processado com sucesso!")
-                else:
-                    st.error("Erro ao processar o arquivo. Verifique o formato ou os dados.")
+            # A leitura roda em segundo plano; o progresso e os erros aparecem junto da tarefa
+            if arquivo is None:
+                st.error("Erro ao processar o arquivo. Verifique o formato ou os dados.")
+            elif carregar_dados(arquivo) is not None:
+                st.success("Arquivo processado com sucesso!")
+        if arquivo is not None and st.button("Salvar como Dataset", help="Converte o arquivo para formato colunar para reabrir depois sem reprocessar o Excel"):
+            dados = carregar_dados(arquivo)
+            if dados is None:
+                st.info("O arquivo ainda está sendo processado. Clique em salvar de novo quando a leitura terminar.")
+            else:
+                try:
+                    metadados = salvar_dataset(dados, arquivo.name, origem=arquivo.name, hash_origem=hash_do_arquivo(arquivo))
+                    st.success(f"Dataset '{metadados['nome']}' salvo com {metadados['linhas']} linhas.")
+                except Exception as e:
+                    st.error(f"Erro ao salvar o dataset: {e}")
+        # Planilhas mensais: cada arquivo vira uma partição de um dataset salvo, com os agregados guardados ao lado
+        if arquivo is not None:
+            with st.expander("Anexar a um dataset salvo"):
+                novo_dataset = "Novo dataset (nome do arquivo)"
+                destino = st.selectbox("Dataset de destino", [novo_dataset] + [m["nome"] for m in listar_datasets()])
+                substituir = st.checkbox("Substituir o período se ele já estiver no dataset", help="Use quando o arquivo é uma versão corrigida de um período já anexado")
+                if st.button("Anexar ao Dataset", help="Grava só este arquivo como uma nova partição; os KPIs do histórico são atualizados sem reprocessar os períodos anteriores"):
+                    dados = carregar_dados(arquivo)
+                    if dados is None:
+                        st.info("O arquivo ainda está sendo processado. Clique em anexar de novo quando a leitura terminar.")
+                    else:
+                        try:
+                            with medidor.etapa("anexacao_dataset", linhas=len(dados)):
+                                metadados = anexar_ao_dataset(dados, arquivo.name if destino == novo_dataset else destino, origem=arquivo.name, hash_origem=hash_do_arquivo(arquivo), substituir=substituir)
+                            st.success(f"Arquivo anexado ao dataset '{metadados['nome']}' ({len(metadados['particoes'])} partições, {metadados['linhas']} linhas).")
+                        except ErroCatalogo as e:
+                            st.warning(str(e))
+                        except Exception as e:
+                            st.error(f"Erro ao anexar ao dataset: {e}")
+
+        # Datasets salvos anteriormente, abertos sem passar pelo Excel
+        datasets_salvos = {m["nome"]: m for m in listar_datasets()}
+        dataset_escolhido = st.selectbox("Ou abra um dataset salvo", ["Nenhum"] + list(datasets_salvos))
+        colunas_escolhidas = None
+        if dataset_escolhido != "Nenhum":
+            metadados = datasets_salvos[dataset_escolhido]
+            colunas_escolhidas = st.multiselect("Colunas a carregar", metadados["colunas"], default=metadados["colunas"])
 
     # Inicializar kpis como dicionário vazio
     kpis = {}
-
-    if arquivo is not None:
-        dados = processar_dados(arquivo)
+    # Gráficos já renderizados nesta execução, incluídos no PDF exportado
+    imagens_relatorio = []
+    # Linhas que passam nos filtros atuais; só são copiadas se a exportação para Excel pedir
+    obter_linhas_filtradas = None
+    filtros_atuais = None
+    # Identifica os KPIs exibidos, para as exportações iguais serem reaproveitadas
+    chave_relatorio = None
+
+    if modo_streaming and arquivo is not None:
+        kpis = calcular_kpis_streaming(arquivo)
+        chave_relatorio = (hash_do_arquivo(arquivo), "kpis_streaming")
+        if kpis:
+            exibir_kpis(kpis)
+    elif arquivo is not None or dataset_escolhido != "Nenhum":
+        # Agregados guardados de um dataset montado por anexação; só valem com todas as colunas carregadas
+        parcial_guardado = None
+        if arquivo is not None:
+            dados = carregar_dados(arquivo)
+        else:
+            dados = abrir_dataset_salvo(dataset_escolhido, colunas_escolhidas, datasets_salvos[dataset_escolhido]["criado_em"])
+            if datasets_salvos[dataset_escolhido].get("particoes") and set(datasets_salvos[dataset_escolhido]["colunas"]) <= set(colunas_escolhidas):
+                parcial_guardado = lambda: parcial_dataset(dataset_escolhido)
         if dados is not None:
-            # Calcular KPIs
-            kpis = calcular_kpis(dados)
+            memoria = dados.attrs.get("memoria_bytes")
+            if memoria:
+                st.caption(f"Dados na memória: {memoria['depois'] / (1024 * 1024):.1f} MB (antes da otimização de tipos: {memoria['antes'] / (1024 * 1024):.1f} MB)")
+
+            chave_dados = dados.attrs.get("chave_cache")
+            chave_relatorio = (dataset_da_chave(chave_dados), "kpis", chave_dados)
+
+            # Calcular os agregados parciais (em segundo plano na primeira vez); deles saem os KPIs
+            # e a série temporal do gráfico de vendas ao longo do tempo, sem outra passada pelas linhas.
+            # Num dataset montado por anexação, vêm da combinação já guardada dos parciais de cada partição
+            montar_parcial = lambda: (parcial_guardado and parcial_guardado()) or ParcialKPI.de_dados(dados)
+            parcial = obter_derivado(dados, "parcial", montar_parcial, descricao="Cálculo dos KPIs")
+            kpis = obter_derivado(dados, "kpis", parcial.kpis) if parcial is not None else {}
             
             # Exibir KPIs em colunas
-            st.subheader("KPIs Calculados")
-            col1, col2 = st.columns(2)
-            with col1:
-                for kpi, valor in list(kpis.items())[:len(kpis)//2]:
-                    if isinstance(valor, (int, float)):
-                        st.write(f"**{kpi}:** {valor:.2f}")
-                    else:
-                        st.write(f"**{kpi}:** {valor}")
-            with col2:
-                for kpi, valor in list(kpis.items())[len(kpis)//2:]:
-                    if isinstance(valor, (int, float)):
-                        st.write(f"**{kpi}:** {valor:.2f}")
-                    else:
-                        st.write(f"**{kpi}:** {valor}")
+            if kpis:
+                exibir_kpis(kpis)
 
-            # Exibir gráficos
+            # Exibir gráficos (renderizados em segundo plano na primeira vez)
             st.subheader("Gráficos Didáticos")
-            fig = criar_graficos(dados)
-            if fig is not None:
-                st.pyplot(fig)
+            imagem = None
+            if parcial is not None:
+                imagem = em_segundo_plano(lambda: grafico_guardado((chave_dados, None, "painel")), (dataset_da_chave(chave_dados), "graficos", chave_dados), "Renderização dos gráficos", renderizar_painel, dados, parcial.serie)
+            if imagem is not None:
+                st.image(imagem)
+                imagens_relatorio.append(("Relatórios Visuais de KPIs", imagem))
 
             # Filtros interativos
             st.subheader("Filtros Interativos")
-            data_inicio = st.date_input("Data de Início", dados["Sale_Date"].min() if "Sale_Date" in dados.columns else datetime.now())
-            data_fim = st.date_input("Data de Fim", dados["Sale_Date"].max() if "Sale_Date" in dados.columns else datetime.now())
-            categoria = st.selectbox("Filtrar por Categoria", ["Todos"] + list(dados["Product_Category"].unique()) if "Product_Category" in dados.columns else ["Todos"])
-            canal = st.selectbox("Filtrar por Canal", ["Todos"] + list(dados["Sales_Channel"].unique()) if "Sales_Channel" in dados.columns else ["Todos"])
-
-            dados_filtrados = dados.copy()
-            if "Sale_Date" in dados.columns:
-                dados_filtrados = dados_filtrados[(dados_filtrados["Sale_Date"].dt.date >= data_inicio) & (dados_filtrados["Sale_Date"].dt.date <= data_fim)]
-            if categoria != "Todos" and "Product_Category" in dados.columns:
-                dados_filtrados = dados_filtrados[dados_filtrados["Product_Category"] == categoria]
-            if canal != "Todos" and "Sales_Channel" in dados.columns:
-                dados_filtrados = dados_filtrados[dados_filtrados["Sales_Channel"] == canal]
-
-            kpis_filtrados = calcular_kpis(dados_filtrados)
-            st.subheader("KPIs Filtrados")
-            for kpi, valor in kpis_filtrados.items():
-                if isinstance(valor, (int, float)):
-                    st.write(f"**{kpi}:** {valor:.2f}")
-                else:
-                    st.write(f"**{kpi}:** {valor}")
+            indice = obter_indice(dados)
+            data_inicio = st.date_input("Data de Início", indice.data_min or datetime.now())
+            data_fim = st.date_input("Data de Fim", indice.data_max or datetime.now())
+            categoria = st.selectbox("Filtrar por Categoria", ["Todos"] + indice.valores("Product_Category") if "Product_Category" in dados.columns else ["Todos"])
+            canal = st.selectbox("Filtrar por Canal", ["Todos"] + indice.valores("Sales_Channel") if "Sales_Channel" in dados.columns else ["Todos"])
+
+            # KPIs filtrados respondidos pelo cubo de agregados, sem varrer as linhas de novo
+            cubo = obter_cubo(dados)
+            kpis_filtrados = None
+            if cubo is not None:
+                with medidor.etapa("kpis_filtrados", linhas=len(dados)):
+                    kpis_filtrados = obter_derivado(dados, "kpis_filtrados", lambda: cubo.kpis(data_inicio, data_fim, categoria, canal), data_inicio, data_fim, categoria, canal)
+            with st.expander("Ver linhas filtradas"):
+                # Só as posições das linhas filtradas são calculadas; apenas as 1000 exibidas são copiadas
+                posicoes = indice.posicoes(data_inicio, data_fim, categoria, canal)
+                st.write(f"{len(posicoes)} linhas no filtro (exibindo até 1000).")
+                st.dataframe(indice.dados.iloc[posicoes[:1000]])
+            obter_linhas_filtradas = lambda: indice.filtrar(data_inicio, data_fim, categoria, canal)
+            filtros_atuais = (data_inicio, data_fim, categoria, canal)
+            if kpis_filtrados is not None:
+                st.subheader("KPIs Filtrados")
+                for kpi, valor in kpis_filtrados.items():
+                    if isinstance(valor, (int, float)):
+                        st.write(f"**{kpi}:** {valor:.2f}")
+                    else:
+                        st.write(f"**{kpi}:** {valor}")
 
-            # Chat simples para solicitar relatórios
+            # Chat para solicitar relatórios: o pedido vira uma consulta (medida, dimensão, filtros, período)
+            # respondida pelos agregados do dataset, montados uma vez em segundo plano
             st.subheader("Chat para Solicitar Relatórios")
-            mensagem = st.text_input("Digite sua solicitação (ex.: 'Quero relatório de vendas por categoria')")
-            if st.button("Enviar"):
-                if "vendas por categoria" in mensagem.lower() and "Product_Category" in dados.columns:
-                    st.write("### Relatório de Vendas por Categoria")
-                    vendas_categoria = dados.groupby("Product_Category")["Sales_Amount"].sum().dropna()
-                    if not vendas_categoria.empty:
-                        st.write(vendas_categoria)
-                    else:
-                        st.write("Sem dados disponíveis para este relatório.")
-                elif "vendas por canal" in mensagem.lower() and "Sales_Channel" in dados.columns:
-                    st.write("### Relatório de Vendas por Canal")
-                    vendas_canal = dados.groupby("Sales_Channel")["Sales_Amount"].sum().dropna()
-                    if not vendas_canal.empty:
-                        st.write(vendas_canal)
-                    else:
-                        st.write("Sem dados disponíveis para este relatório.")
-                elif "vendas por região" in mensagem.lower() and "Region_and_Sales_Rep" in dados.columns:
-                    st.write("### Relatório de Vendas por Região/Representante")
-                    vendas_regiao = dados.groupby("Region_and_Sales_Rep")["Sales_Amount"].sum().dropna()
-                    if not vendas_regiao.empty:
-                        st.write(vendas_regiao)
-                    else:
-                        st.write("Sem dados disponíveis para este relatório.")
-                elif "lucro por categoria" in mensagem.lower() and "Product_Category" in dados.columns:
-                    st.write("### Relatório de Lucro por Categoria")
-                    lucro_categoria = (dados.groupby("Product_Category")["Sales_Amount"].sum() - dados.groupby("Product_Category")["Unit_Cost"].sum() * dados.groupby("Product_Category")["Quantity_Sold"].sum()).dropna()
-                    if not lucro_categoria.empty:
-                        st.write(lucro_categoria)
+            motor_consultas = obter_consultas(dados)
+            mensagem = st.text_input("Digite sua solicitação (ex.: 'Quero relatório de vendas por categoria' ou 'lucro por canal em 2024')")
+            if st.button("Enviar") and motor_consultas is not None:
+                try:
+                    with medidor.etapa("consulta_chat"):
+                        consulta, resultado = motor_consultas.responder(mensagem)
+                except ErroConsulta as e:
+                    st.write(str(e))
+                else:
+                    st.write(f"### Relatório de {consulta.titulo()}")
+                    if not resultado.empty:
+                        st.write(resultado)
                     else:
                         st.write("Sem dados disponíveis para este relatório.")
-                else:
-                    st.write("Desculpe, não entendi. Tente 'vendas por categoria', 'vendas por canal', 'vendas por região', ou 'lucro por categoria'.")
 
             # Botões interativos para categorias
             st.subheader("Navegação por Categorias")
@@ -364,79 +513,77 @@ elif authentication_status:
             if st.button("Gerar Relatório"):
                 if categoria_selecionada == "Product_Category" and "Sales_Amount" in dados.columns:
                     st.write("### Vendas por Categoria")
-                    vendas = dados.groupby("Product_Category")["Sales_Amount"].sum().dropna()
+                    vendas = dados.groupby("Product_Category", observed=True)["Sales_Amount"].sum().dropna()
                     if not vendas.empty:
                         st.write(vendas)
-                        fig, ax = plt.subplots(figsize=(8, 6))
-                        sns.barplot(x=vendas.index, y=vendas.values, ax=ax, palette="Blues_d")
-                        ax.set_title("Vendas por Categoria")
-                        ax.tick_params(axis='x', rotation=45)
-                        st.pyplot(fig)
+                        st.image(grafico_em_cache((chave_dados, None, categoria_selecionada), lambda: grafico_vendas_dimensao(vendas, categoria_selecionada)))
                     else:
                         st.write("Sem dados disponíveis para este relatório.")
                 elif categoria_selecionada == "Sales_Channel" and "Sales_Amount" in dados.columns:
                     st.write("### Vendas por Canal")
-                    vendas = dados.groupby("Sales_Channel")["Sales_Amount"].sum().dropna()
+                    vendas = dados.groupby("Sales_Channel", observed=True)["Sales_Amount"].sum().dropna()
                     if not vendas.empty:
                         st.write(vendas)
-                        fig, ax = plt.subplots(figsize=(8, 6))
-                        vendas.plot(kind="pie", ax=ax, autopct='%1.1f%%', colors=['#FF6B6B', '#4ECDC4', '#45B7D1'])
-                        ax.set_title("Vendas por Canal")
-                        st.pyplot(fig)
+                        st.image(grafico_em_cache((chave_dados, None, categoria_selecionada), lambda: grafico_vendas_dimensao(vendas, categoria_selecionada)))
                     else:
                         st.write("Sem dados disponíveis para este relatório.")
                 elif categoria_selecionada == "Region_and_Sales_Rep" and "Sales_Amount" in dados.columns:
                     st.write("### Vendas por Região/Representante")
-                    vendas = dados.groupby("Region_and_Sales_Rep")["Sales_Amount"].sum().dropna()
+                    vendas = dados.groupby("Region_and_Sales_Rep", observed=True)["Sales_Amount"].sum().dropna()
                     if not vendas.empty:
                         st.write(vendas)
-                        fig, ax = plt.subplots(figsize=(8, 6))
-                        sns.barplot(x=vendas.index, y=vendas.values, ax=ax, palette="Purples_d")
-                        ax.set_title("Vendas por Região/Representante")
-                        ax.tick_params(axis='x', rotation=45)
-                        st.pyplot(fig)
+                        st.image(grafico_em_cache((chave_dados, None, categoria_selecionada), lambda: grafico_vendas_dimensao(vendas, categoria_selecionada)))
                     else:
                         st.write("Sem dados disponíveis para este relatório.")
 
-            # Exportação de relatórios
-            st.subheader("Exportar Relatórios")
-            col_exp1, col_exp2, col_exp3 = st.columns(3)
-            with col_exp1:
-                if st.button("Exportar para Excel"):
-                    if kpis:
-                        df_kpis = pd.DataFrame(list(kpis.items()), columns=["KPI", "Valor"])
-                        df_kpis.loc[len(df_kpis)] = ["Data do Relatório", datetime.now().strftime('%d/%m/%Y %H:%M')]
-                        output = BytesIO()
-                        writer = pd.ExcelWriter(output, engine='openpyxl')
-                        df_kpis.to_excel(writer, index=False, sheet_name='KPIs')
-                        writer.close()
-                        output.seek(0)
-                        st.download_button(
-                            label="Baixar Excel",
-                            data=output.getvalue(),
-                            file_name="relatorio_kpis.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
-            with col_exp2:
-                if st.button("Exportar para PDF"):
-                    if kpis:
-                        pdf_buffer = exportar_pdf(kpis)
-                        st.download_button(
-                            label="Baixar PDF",
-                            data=pdf_buffer.getvalue(),
-                            file_name="relatorio_kpis.pdf",
-                            mime="application/pdf"
-                        )
-            with col_exp3:
-                if st.button("Exportar para CSV"):
-                    if kpis:
-                        csv_buffer = exportar_csv(kpis)
-                        st.download_button(
-                            label="Baixar CSV",
-                            data=csv_buffer.getvalue(),
-                            file_name="relatorio_kpis.csv",
-                            mime="text/csv"
-                        )
+    # Exportação de relatórios (também disponível no modo streaming)
+    # Excel e PDF são gerados em segundo plano; a chave da tarefa fica na sessão até o arquivo ser baixado
+    if kpis:
+        st.subheader("Exportar Relatórios")
+        exportacoes = st.session_state.setdefault("exportacoes", {})
+        col_exp1, col_exp2, col_exp3 = st.columns(3)
+        with col_exp1:
+            incluir_linhas = obter_linhas_filtradas is not None and st.checkbox("Incluir linhas filtradas no Excel")
+            # O arquivo só é gerado no clique; a gravação usa o modo de memória constante do xlsxwriter
+            if st.button("Exportar para Excel"):
+                # A chave inclui o usuário: cada usuário baixa (e descarta) as próprias exportações
+                chave = (chave_relatorio, "exportacao_excel", usuario, filtros_atuais if incluir_linhas else None)
+                EXECUTOR_TAREFAS.submeter(chave, gerar_excel, kpis, obter_linhas_filtradas if incluir_linhas else None, descricao="Exportação para Excel", sessao=id_sessao)
+                exportacoes["excel"] = chave
+            baixar_exportacao(exportacoes, "excel", "Baixar Excel", "relatorio_kpis.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        with col_exp2:
+            if st.button("Exportar para PDF"):
+                chave = (chave_relatorio, "exportacao_pdf", usuario, len(imagens_relatorio))
+                EXECUTOR_TAREFAS.submeter(chave, gerar_pdf, kpis, imagens_relatorio, descricao="Exportação para PDF", sessao=id_sessao)
+                exportacoes["pdf"] = chave
+            baixar_exportacao(exportacoes, "pdf", "Baixar PDF", "relatorio_kpis.pdf", "application/pdf")
+        with col_exp3:
+            if st.button("Exportar para CSV"):
+                if kpis:
+                    csv_buffer = exportar_csv(kpis)
+                    st.download_button(
+                        label="Baixar CSV",
+                        data=csv_buffer.getvalue(),
+                        file_name="relatorio_kpis.csv",
+                        mime="text/csv"
+                    )
+
+    # Painel de desempenho (somente administradores), no fim para incluir todas as etapas desta execução
+    if eh_admin:
+        with st.sidebar.expander("Desempenho"):
+            st.write(f"Execução {medidor.execucao}")
+            if medidor.registros:
+                st.dataframe(pd.DataFrame(medidor.registros).drop(columns=["execucao"]))
+            else:
+                st.write("Nenhuma etapa pesada nesta execução (resultados vindos do cache).")
+            st.write("Cache compartilhado")
+            st.json(CACHE_COMPARTILHADO.estatisticas())
+            tarefas = EXECUTOR_TAREFAS.tarefas()
+            if tarefas:
+                st.write("Tarefas em segundo plano")
+                st.dataframe(pd.DataFrame([{"tarefa": t.descricao, "estado": t.estado, "progresso": t.progresso, "segundos": round(t.segundos, 2)} for t in tarefas]))
+            if st.checkbox("Mostrar histórico"):
+                st.dataframe(pd.DataFrame(list(medidor.historico)))
 
     # Estilização visual avançada
     st.markdown("""
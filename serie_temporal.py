@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+
+# Granularidades das séries e a frequência de período do pandas correspondente
+GRANULARIDADES = {
+    "diaria": "D",
+    "semanal": "W",
+    "mensal": "M",
+    "trimestral": "Q",
+    "anual": "Y",
+}
+# Períodos em um ano, para comparar cada período com o mesmo período do ano anterior
+# (na série diária a comparação é feita pela data, por causa dos anos bissextos)
+PERIODOS_POR_ANO = {"semanal": 52, "mensal": 12, "trimestral": 4, "anual": 1}
+# Granularidades disponíveis por dimensão (as vendas por dimensão são guardadas por mês)
+GRANULARIDADES_DIMENSAO = ("mensal", "trimestral", "anual")
+
+
+# Função para converter as datas em dias (datetime64[D]); datas inválidas viram NaT
+def _dias(datas):
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        datas = pd.to_datetime(datas, errors="coerce")
+    if getattr(datas.dt, "tz", None) is not None:
+        datas = datas.dt.tz_localize(None)
+    return datas.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+
+
+# Função para somar tabelas indexadas por período/dia (partes diferentes dos mesmos dados)
+def _somar_tabelas(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a.add(b, fill_value=0).sort_index()
+
+
+class SerieTemporal:
+    """Vendas somadas por dia (e por mês em cada dimensão), das quais saem as séries semanais, mensais e trimestrais.
+
+    As linhas são lidas uma única vez; médias móveis, crescimentos e acumulados são calculados sobre os períodos."""
+
+    def __init__(self, diaria=None, mensal_dimensoes=None):
+        # Índice: dia; colunas: linhas e a soma de cada medida
+        self.diaria = diaria if diaria is not None else pd.DataFrame(columns=["linhas"], index=pd.DatetimeIndex([], name="dia"), dtype="float64")
+        # dimensão -> tabela (mês x valor da dimensão) com a soma de Sales_Amount
+        self.mensal_dimensoes = mensal_dimensoes or {}
+        self._series = {}
+
+    # Função para montar a série a partir das linhas, numa única passada
+    # Os dias viram códigos pela distância ao primeiro dia (sem tabela de hash) e as somas saem de np.bincount
+    @classmethod
+    def de_dados(cls, dados, medidas, dimensoes=(), datas=None):
+        dias = _dias(dados["Sale_Date"] if datas is None else datas)
+        validos = ~np.isnat(dias)
+        if not validos.any():
+            return cls()
+        todos_validos = validos.all()
+        dias = dias if todos_validos else dias[validos]
+        primeiro = dias.min()
+        codigos = (dias - primeiro).astype("int64")
+        n = int(codigos.max()) + 1
+        linhas = np.bincount(codigos, minlength=n)
+        somas = {}
+        for medida in medidas:
+            valores = dados[medida].to_numpy(dtype="float64", na_value=np.nan)
+            valores = valores if todos_validos else valores[validos]
+            somas[medida] = np.bincount(codigos, weights=np.nan_to_num(valores), minlength=n)
+        # Só os dias com linhas entram na série diária
+        com_linhas = np.flatnonzero(linhas)
+        diaria = pd.DataFrame(
+            {"linhas": linhas[com_linhas].astype("float64"), **{medida: soma[com_linhas] for medida, soma in somas.items()}},
+            index=pd.DatetimeIndex(primeiro + com_linhas, name="dia"),
+        )
+
+        mensal_dimensoes = {}
+        if "Sales_Amount" in medidas and dimensoes:
+            # Mês de cada dia do intervalo e, a partir dele, o mês de cada linha
+            meses_por_dia = (primeiro + np.arange(n)).astype("datetime64[M]")
+            primeiro_mes = meses_por_dia[0]
+            n_meses = int((meses_por_dia[-1] - primeiro_mes).astype("int64")) + 1
+            codigos_mes = (meses_por_dia - primeiro_mes).astype("int64")[codigos]
+            vendas = dados["Sales_Amount"].to_numpy(dtype="float64", na_value=np.nan)
+            vendas = np.nan_to_num(vendas if todos_validos else vendas[validos])
+            for dimensao in dimensoes:
+                # Em colunas categóricas o factorize reaproveita os códigos das categorias
+                codigos_valor, valores = pd.factorize(dados[dimensao], sort=True)
+                codigos_valor = codigos_valor if todos_validos else codigos_valor[validos]
+                presentes = codigos_valor >= 0
+                combinados = codigos_mes[presentes] * len(valores) + codigos_valor[presentes]
+                tabela = np.bincount(combinados, weights=vendas[presentes], minlength=n_meses * len(valores)).reshape(n_meses, len(valores))
+                mensal_dimensoes[dimensao] = pd.DataFrame(
+                    tabela,
+                    index=pd.period_range(pd.Period(primeiro_mes, "M"), periods=n_meses, freq="M", name="mes"),
+                    columns=pd.Index(np.asarray(valores, dtype=object), dtype=object, name=dimensao),
+                )
+        return cls(diaria, mensal_dimensoes)
+
+    # Função para montar a série a partir de uma tabela já agregada por dia (ex.: a base do CuboKPI)
+    # colunas: coluna da tabela -> nome na série (ex.: {"_linhas": "linhas", "soma_Sales_Amount": "Sales_Amount"})
+    # dimensoes: dimensão -> tabela com as colunas dia, a dimensão e vendas (a coluna de soma de Sales_Amount)
+    @classmethod
+    def de_agregados(cls, tabela, colunas, dimensoes=None, vendas="soma_Sales_Amount"):
+        tabela = tabela[tabela["dia"].notna()]
+        if tabela.empty:
+            return cls()
+        diaria = tabela.groupby("dia")[list(colunas)].sum().rename(columns=colunas).astype("float64")
+        mensal_dimensoes = {}
+        for dimensao, agregado in (dimensoes or {}).items():
+            agregado = agregado[agregado["dia"].notna()]
+            meses = agregado["dia"].dt.to_period("M").rename("mes")
+            mensal = agregado.groupby([meses, agregado[dimensao]], observed=True)[vendas].sum().unstack(fill_value=0.0)
+            mensal.columns = pd.Index(mensal.columns.astype(object), dtype=object, name=dimensao)
+            mensal_dimensoes[dimensao] = mensal
+        return cls(diaria, mensal_dimensoes)
+
+    # Função para combinar outra série nesta (a ordem das partes não altera o resultado)
+    def combinar(self, outra):
+        if not outra.diaria.empty:
+            self.diaria = outra.diaria if self.diaria.empty else _somar_tabelas(self.diaria, outra.diaria)
+        for dimensao, tabela in outra.mensal_dimensoes.items():
+            self.mensal_dimensoes[dimensao] = _somar_tabelas(self.mensal_dimensoes.get(dimensao), tabela).fillna(0.0)
+        self._series = {}
+        return self
+
+    @property
+    def vazia(self):
+        return self.diaria.empty
+
+    # Função para obter a tabela de uma granularidade (períodos x colunas da série diária), com memória
+    # completa=True inclui os períodos sem vendas (com zero), para deslocamentos e janelas contarem períodos de verdade
+    def tabela(self, granularidade="mensal", completa=True):
+        chave = ("tabela", granularidade, completa)
+        if chave not in self._series:
+            frequencia = GRANULARIDADES[granularidade]
+            tabela = self.diaria.groupby(self.diaria.index.to_period(frequencia)).sum()
+            if completa and not tabela.empty:
+                tabela = tabela.reindex(pd.period_range(tabela.index.min(), tabela.index.max(), freq=frequencia), fill_value=0.0)
+            elif not completa:
+                tabela = tabela[tabela["linhas"] > 0]
+            tabela.index.name = "periodo"
+            self._series[chave] = tabela
+        return self._series[chave]
+
+    # Função para obter a série de uma medida na granularidade pedida
+    def serie(self, granularidade="mensal", medida="Sales_Amount", completa=True):
+        tabela = self.tabela(granularidade, completa)
+        if medida not in tabela.columns:
+            return pd.Series(dtype="float64", index=tabela.index.copy(), name=medida)
+        return tabela[medida]
+
+    # Função para calcular a média móvel de janela períodos (períodos sem vendas contam como zero)
+    def media_movel(self, janela, granularidade="mensal", medida="Sales_Amount"):
+        return self.serie(granularidade, medida).rolling(janela, min_periods=janela).mean().dropna()
+
+    # Função para calcular o crescimento (%) em relação ao período anterior (ex.: mês contra mês)
+    # completa=False compara com o último período que teve vendas, como o antigo "Crescimento de Vendas Mensal (%)"
+    def crescimento(self, granularidade="mensal", medida="Sales_Amount", periodos=1, completa=True):
+        serie = self.serie(granularidade, medida, completa)
+        return self._variacao(serie, serie.shift(periodos))
+
+    # Função para calcular o crescimento (%) em relação ao mesmo período do ano anterior
+    def crescimento_anual(self, granularidade="mensal", medida="Sales_Amount"):
+        serie = self.serie(granularidade, medida)
+        if granularidade == "diaria":
+            datas_anteriores = (serie.index.to_timestamp() - pd.DateOffset(years=1)).to_period("D")
+            anterior = pd.Series(serie.reindex(datas_anteriores).to_numpy(), index=serie.index)
+        else:
+            anterior = serie.shift(PERIODOS_POR_ANO[granularidade])
+        return self._variacao(serie, anterior)
+
+    @staticmethod
+    def _variacao(serie, anterior):
+        variacao = (serie / anterior.where(anterior != 0) - 1) * 100
+        return variacao.dropna()
+
+    # Função para calcular o valor acumulado desde o primeiro período (ex.: receita acumulada)
+    def acumulado(self, granularidade="mensal", medida="Sales_Amount"):
+        return self.serie(granularidade, medida).cumsum()
+
+    # Função para obter as vendas de cada valor da dimensão por período (mensal, trimestral ou anual)
+    def por_dimensao(self, dimensao, granularidade="mensal"):
+        if granularidade not in GRANULARIDADES_DIMENSAO:
+            raise ValueError(f"Granularidade '{granularidade}' indisponível por dimensão; use {', '.join(GRANULARIDADES_DIMENSAO)}.")
+        mensal = self.mensal_dimensoes.get(dimensao)
+        if mensal is None or mensal.empty:
+            return None
+        chave = ("dimensao", dimensao, granularidade)
+        if chave not in self._series:
+            frequencia = GRANULARIDADES[granularidade]
+            tabela = mensal if granularidade == "mensal" else mensal.groupby(mensal.index.asfreq(frequencia)).sum()
+            self._series[chave] = tabela.reindex(pd.period_range(tabela.index.min(), tabela.index.max(), freq=frequencia), fill_value=0.0)
+        return self._series[chave]
+
+    # Função para calcular a tendência de cada valor da dimensão: inclinação da reta de mínimos quadrados
+    # das vendas por período (R$ por período), calculada para todas as colunas de uma vez
+    def tendencias(self, dimensao, granularidade="mensal"):
+        tabela = self.por_dimensao(dimensao, granularidade)
+        if tabela is None or len(tabela) < 2:
+            return pd.Series(dtype="float64")
+        x = np.arange(len(tabela), dtype="float64")
+        x -= x.mean()
+        valores = tabela.to_numpy(dtype="float64")
+        inclinacoes = x @ (valores - valores.mean(axis=0)) / (x @ x)
+        return pd.Series(inclinacoes, index=tabela.columns)
+
+    def tamanho_em_bytes(self):
+        tabelas = [self.diaria, *self.mensal_dimensoes.values(), *self._series.values()]
+        return int(sum(t.memory_usage(deep=True).sum() for t in tabelas))
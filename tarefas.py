@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentacao import registrar_evento
+
+# Tarefas executadas ao mesmo tempo; são threads, pois pandas, numpy e a compressão dos arquivos liberam o GIL
+# nas partes pesadas e os resultados (DataFrames, cubos) ficam no mesmo processo que o cache
+MAX_TAREFAS_SIMULTANEAS = int(os.environ.get("KPI_TAREFAS_SIMULTANEAS", "4"))
+# Tarefas terminadas mantidas para o resultado ser buscado nas próximas execuções do script
+MAX_TAREFAS_TERMINADAS = int(os.environ.get("KPI_TAREFAS_TERMINADAS", "32"))
+# Segundos sem acompanhar uma tarefa em andamento (o painel consulta a cada segundo) para a sessão deixar de
+# contar como interessada no resultado
+TOLERANCIA_SESSAO_SEGUNDOS = 5
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDA = "concluída"
+ERRO = "erro"
+CANCELADA = "cancelada"
+ESTADOS_FINAIS = (CONCLUIDA, ERRO, CANCELADA)
+
+
+class TarefaCancelada(Exception):
+    pass
+
+
+class Tarefa:
+    """Trabalho executado em segundo plano, com progresso, avisos, cancelamento e resultado."""
+
+    def __init__(self, chave, descricao):
+        self.chave = chave
+        self.descricao = descricao
+        self.estado = PENDENTE
+        # Fração concluída (0 a 1) ou None quando não dá para estimar
+        self.progresso = None
+        self.mensagem = ""
+        self.avisos = []
+        self.resultado = None
+        self.erro = None
+        self.criada_em = time.time()
+        self.inicio = None
+        self.fim = None
+        self._cancelamento = threading.Event()
+        self._futuro = None
+        # Sessões que aguardam a tarefa (sessão -> última consulta) e as que desistiram dela enquanto outras
+        # ainda aguardavam; a tarefa só é cancelada quando nenhuma outra sessão espera pelo resultado
+        self._sessoes = {}
+        self._desistencias = set()
+
+    @property
+    def terminada(self):
+        return self.estado in ESTADOS_FINAIS
+
+    @property
+    def segundos(self):
+        if self.inicio is None:
+            return 0.0
+        return (self.fim or time.time()) - self.inicio
+
+    # Função chamada pelo trabalho nos pontos em que pode parar; levanta TarefaCancelada se pediram o cancelamento
+    def verificar_cancelamento(self):
+        if self._cancelamento.is_set():
+            raise TarefaCancelada()
+
+    # Função para o trabalho informar o andamento (também é um ponto de cancelamento)
+    def avancar(self, progresso=None, mensagem=None):
+        self.verificar_cancelamento()
+        if progresso is not None:
+            self.progresso = max(0.0, min(1.0, progresso))
+        if mensagem is not None:
+            self.mensagem = mensagem
+
+    def avisar(self, aviso):
+        self.avisos.append(aviso)
+
+    # Função para saber se a sessão pediu o cancelamento, mas a tarefa continuou para outras sessões
+    def desistiu(self, sessao):
+        return sessao in self._desistencias
+
+    # Uma tarefa na fila é cancelada na hora; em execução, para no próximo ponto de cancelamento
+    # (e, se terminar antes disso, o resultado é descartado)
+    def cancelar(self):
+        self._cancelamento.set()
+        if self._futuro is not None and self._futuro.cancel():
+            self._finalizar(CANCELADA)
+
+    def _finalizar(self, estado, resultado=None, erro=None):
+        self.resultado = resultado
+        self.erro = erro
+        self.fim = time.time()
+        self.estado = estado
+        registrar_evento("tarefa", descricao=self.descricao, estado=estado, segundos=round(self.segundos, 4), erro=None if erro is None else f"{type(erro).__name__}: {erro}")
+
+
+class ExecutorTarefas:
+    """Fila de tarefas em segundo plano indexada por chave: tarefas idênticas em andamento não são repetidas."""
+
+    def __init__(self, max_simultaneas=MAX_TAREFAS_SIMULTANEAS, max_terminadas=MAX_TAREFAS_TERMINADAS):
+        self.max_terminadas = max_terminadas
+        self._executor = ThreadPoolExecutor(max_workers=max_simultaneas, thread_name_prefix="tarefa_kpi")
+        self._tarefas = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Função para submeter funcao(tarefa, *args, **kwargs); se já existe uma tarefa com a mesma chave
+    # (em andamento ou terminada e ainda não descartada), ela é devolvida em vez de executar de novo
+    # sessao identifica quem aguarda o resultado (ver cancelar e descartar)
+    def submeter(self, chave, funcao, *args, descricao=None, sessao=None, **kwargs):
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None:
+                self._aguardar(tarefa, sessao)
+                return tarefa
+            tarefa = Tarefa(chave, descricao or str(chave))
+            self._aguardar(tarefa, sessao)
+            self._tarefas[chave] = tarefa
+            self._limpar_terminadas()
+        tarefa._futuro = self._executor.submit(self._executar, tarefa, funcao, args, kwargs)
+        return tarefa
+
+    def _executar(self, tarefa, funcao, args, kwargs):
+        if tarefa._cancelamento.is_set():
+            tarefa._finalizar(CANCELADA)
+            return
+        tarefa.inicio = time.time()
+        tarefa.estado = EXECUTANDO
+        try:
+            resultado = funcao(tarefa, *args, **kwargs)
+            tarefa.verificar_cancelamento()
+        except TarefaCancelada:
+            tarefa._finalizar(CANCELADA)
+        except Exception as e:
+            tarefa._finalizar(ERRO, erro=e)
+        else:
+            tarefa.progresso = 1.0
+            tarefa._finalizar(CONCLUIDA, resultado=resultado)
+
+    def obter(self, chave, sessao=None):
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None:
+                self._aguardar(tarefa, sessao)
+            return tarefa
+
+    # Função para cancelar uma tarefa; com sessao, ela só é cancelada se nenhuma outra sessão aguarda o
+    # resultado (senão continua, e só esta sessão desiste dela)
+    def cancelar(self, chave, sessao=None):
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is None:
+                return None
+            if sessao is not None and self._outra_sessao_aguarda(tarefa, sessao):
+                tarefa._desistencias.add(sessao)
+                return tarefa
+        tarefa.cancelar()
+        return tarefa
+
+    # Função para uma sessão que desistiu de uma tarefa voltar a aguardá-la
+    def retomar(self, chave, sessao):
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None:
+                tarefa._desistencias.discard(sessao)
+                self._aguardar(tarefa, sessao)
+            return tarefa
+
+    # Função para esquecer uma tarefa (cancelando-a se ainda estiver em andamento), liberando o resultado
+    # Com sessao, só esta sessão deixa de aguardar; a tarefa é esquecida quando nenhuma outra a aguarda
+    def descartar(self, chave, sessao=None):
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is None:
+                return None
+            if sessao is not None and self._outra_sessao_aguarda(tarefa, sessao):
+                return tarefa
+            del self._tarefas[chave]
+        if not tarefa.terminada:
+            tarefa.cancelar()
+        return tarefa
+
+    def tarefas(self):
+        with self._lock:
+            return list(self._tarefas.values())
+
+    @staticmethod
+    def _aguardar(tarefa, sessao):
+        if sessao is not None and sessao not in tarefa._desistencias:
+            tarefa._sessoes[sessao] = time.monotonic()
+
+    # Função para saber se outra sessão aguarda a tarefa (tira esta sessão da lista)
+    # Em andamento, só contam as sessões que a consultaram há pouco; terminada, todas as que ainda não a descartaram
+    @staticmethod
+    def _outra_sessao_aguarda(tarefa, sessao):
+        tarefa._sessoes.pop(sessao, None)
+        if tarefa.terminada:
+            return bool(tarefa._sessoes)
+        limite = time.monotonic() - TOLERANCIA_SESSAO_SEGUNDOS
+        return any(consulta >= limite for consulta in tarefa._sessoes.values())
+
+    def _limpar_terminadas(self):
+        terminadas = [chave for chave, tarefa in self._tarefas.items() if tarefa.terminada]
+        for chave in terminadas[:max(0, len(terminadas) - self.max_terminadas)]:
+            del self._tarefas[chave]
+
+
+# Executor único do processo, compartilhado por todas as sessões (o módulo é importado uma única vez pelo Streamlit)
+EXECUTOR_TAREFAS = ExecutorTarefas()
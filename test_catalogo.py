@@ -0,0 +1,78 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from armazenamento import carregar_dataset, caminho_particao, gravar_metadados, gravar_tabela
+from catalogo import anexar_ao_dataset
+
+
+def _mes(ano, mes, pagamentos):
+    return pd.DataFrame({
+        "Sale_Date": pd.to_datetime([f"{ano}-{mes:02d}-{dia:02d}" for dia in range(1, len(pagamentos) + 1)]),
+        "Product_Category": ["Electronics", "Clothing", "Furniture"][:len(pagamentos)],
+        "Payment_Method": pagamentos,
+        "Sales_Amount": [100.0, 250.5, 80.25][:len(pagamentos)],
+        "Quantity_Sold": [1, 3, 2][:len(pagamentos)],
+    })
+
+
+@pytest.mark.parametrize("formato", ["arrow", "parquet"])
+@pytest.mark.parametrize("categorica_primeiro", [True, False])
+def test_texto_categorico_num_mes_e_texto_no_outro(tmp_path, formato, categorica_primeiro):
+    janeiro = _mes(2024, 1, ["Cash", "Credit Card", "Cash"])
+    fevereiro = _mes(2024, 2, ["Debit Card", "Cash", "Pix"])
+    primeiro, segundo = (janeiro, fevereiro) if categorica_primeiro else (fevereiro, janeiro)
+    primeiro["Payment_Method"] = primeiro["Payment_Method"].astype("category")
+
+    anexar_ao_dataset(primeiro, "vendas", formato=formato, diretorio=str(tmp_path))
+    metadados = anexar_ao_dataset(segundo, "vendas", formato=formato, diretorio=str(tmp_path))
+    dados = carregar_dataset("vendas", diretorio=str(tmp_path))
+
+    assert [p["id"] for p in metadados["particoes"]] == ["p0001", "p0002"]
+    esperado = pd.concat([primeiro, segundo], ignore_index=True)
+    assert dados["Payment_Method"].astype(object).tolist() == esperado["Payment_Method"].astype(object).tolist()
+    assert dados["Sales_Amount"].sum() == pytest.approx(esperado["Sales_Amount"].sum())
+
+
+# Partições gravadas antes de a partição nova seguir o esquema do dataset continuam abrindo
+def test_particoes_ja_gravadas_com_tipos_diferentes(tmp_path):
+    janeiro = _mes(2024, 1, ["Cash", "Credit Card", "Cash"])
+    janeiro["Payment_Method"] = janeiro["Payment_Method"].astype("category")
+    fevereiro = _mes(2024, 2, ["Debit Card", "Cash", "Pix"])
+    (tmp_path / "vendas").mkdir()
+    for particao, dados in (("p0001", janeiro), ("p0002", fevereiro)):
+        gravar_tabela(dados, caminho_particao("vendas", particao, "arrow", str(tmp_path)), "arrow")
+    gravar_metadados({
+        "nome": "vendas",
+        "formato": "arrow",
+        "linhas": 6,
+        "colunas": janeiro.columns.tolist(),
+        "particoes": [{"id": "p0001", "linhas": 3}, {"id": "p0002", "linhas": 3}],
+    }, str(tmp_path))
+
+    dados = carregar_dataset("vendas", diretorio=str(tmp_path))
+
+    assert dados["Payment_Method"].tolist() == ["Cash", "Credit Card", "Cash", "Debit Card", "Cash", "Pix"]
+
+
+def test_anexacoes_simultaneas_usam_particoes_diferentes(tmp_path):
+    meses = [_mes(2024, mes, ["Cash", "Pix", "Cash"]) for mes in range(1, 9)]
+    erros = []
+
+    def anexar(dados):
+        try:
+            anexar_ao_dataset(dados, "vendas", diretorio=str(tmp_path))
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=anexar, args=(dados,)) for dados in meses]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not erros
+    dados = carregar_dataset("vendas", diretorio=str(tmp_path))
+    assert len(dados) == 3 * len(meses)
+    assert sorted(dados["Sale_Date"].dt.month.unique()) == list(range(1, 9))
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from exportacao import exportar_excel
+
+openpyxl = pytest.importorskip("openpyxl")
+pytest.importorskip("xlsxwriter")
+
+
+# Linhas brutas com Sale_Date com fuso e um inf em Sales_Amount faziam o xlsxwriter falhar
+def test_excel_com_datas_com_fuso_e_inf():
+    dados = pd.DataFrame({
+        "Sale_Date": pd.to_datetime(["2024-01-05 10:30", "2024-01-06 08:00", None]).tz_localize("America/Sao_Paulo"),
+        "Sales_Amount": [100.5, np.inf, 80.0],
+    })
+
+    arquivo = exportar_excel({"Receita Total": 100.5, "Crescimento de Vendas Mensal (%)": {"2024-01": np.inf}}, dados=dados)
+    livro = openpyxl.load_workbook(arquivo)
+    linhas = list(livro["Dados Filtrados"].iter_rows(min_row=2, values_only=True))
+
+    assert linhas[0] == (datetime(2024, 1, 5, 10, 30), 100.5)
+    assert linhas[1] == (datetime(2024, 1, 6, 8, 0), None)
+    assert linhas[2] == (None, 80.0)
+    assert livro["Crescimento Mensal"]["B2"].value is None
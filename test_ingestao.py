@@ -0,0 +1,47 @@
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from agregacao import ParcialKPI
+from ingestao import ErroIngestao, agregar_em_streaming, carregar_arquivo, validar_bloco
+
+
+def _csv(vendas):
+    dados = pd.DataFrame({
+        "Sale_Date": pd.date_range("2024-01-01", periods=len(vendas), freq="D").strftime("%Y-%m-%d"),
+        "Product_Category": ["Electronics", "Clothing"] * (len(vendas) // 2) + ["Furniture"] * (len(vendas) % 2),
+        "Sales_Amount": vendas,
+        "Quantity_Sold": [2] * len(vendas),
+        "Unit_Cost": [10.0] * len(vendas),
+    })
+    return dados.to_csv(index=False).encode()
+
+
+# Um valor não numérico num bloco do CSV fazia o bloco inteiro ficar de fora das somas
+def test_bloco_com_valor_nao_numerico():
+    conteudo = _csv([100.0] * 5 + ["abc"] + [100.0] * 4)
+
+    with pytest.raises(ErroIngestao, match="Sales_Amount"):
+        agregar_em_streaming(BytesIO(conteudo), "vendas.csv", tamanho_bloco=3)
+    with pytest.raises(ErroIngestao, match="Sales_Amount"):
+        carregar_arquivo(BytesIO(conteudo), "vendas.csv")
+
+
+def test_bloco_com_numeros_como_texto_entra_nas_somas():
+    conteudo = _csv([100.0, 50.5, 25.25, 10.0])
+    esperado = ParcialKPI.de_dados(carregar_arquivo(BytesIO(conteudo), "vendas.csv")[0]).kpis()
+    bloco = pd.DataFrame({"Sale_Date": ["2024-01-01", "2024-01-02"], "Sales_Amount": ["100", "50.5"]})
+
+    parcial, _ = agregar_em_streaming(BytesIO(conteudo), "vendas.csv", tamanho_bloco=1)
+
+    assert validar_bloco(bloco)["Sales_Amount"].tolist() == [100.0, 50.5]
+    assert parcial.kpis()["Receita Total"] == pytest.approx(esperado["Receita Total"])
+    assert parcial.linhas == 4
+
+
+def test_bloco_sem_coluna_do_cabecalho():
+    bloco = pd.DataFrame({"Sale_Date": ["2024-01-01"], "Sales_Amount": [100.0]})
+
+    with pytest.raises(ErroIngestao, match="Unit_Cost"):
+        validar_bloco(bloco, ["Sale_Date", "Sales_Amount", "Unit_Cost"])
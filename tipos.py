@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Colunas de texto com até esta fração de valores distintos viram categóricas (ex.: 0.5 = no máximo metade das linhas)
+LIMITE_CARDINALIDADE = float(os.environ.get("KPI_LIMITE_CARDINALIDADE", "0.5"))
+# Colunas de valores que entram nas somas dos KPIs: ficam em float64, porque o pandas soma float32 em float32
+# e os totais perdem precisão (ex.: a Receita Total de milhões de linhas)
+COLUNAS_MONETARIAS = ["Sales_Amount", "Unit_Cost", "Unit_Price", "Discount"]
+
+
+# Função para medir a memória ocupada pelo DataFrame, incluindo o conteúdo das strings
+def memoria_em_bytes(dados):
+    return int(dados.memory_usage(index=True, deep=True).sum())
+
+
+# Função para reduzir uma coluna inteira ao menor tipo com sinal que comporta todos os valores
+# (sem tipos sem sinal, para que subtrações entre colunas continuem podendo dar negativo)
+def reduzir_inteiros(coluna):
+    return pd.to_numeric(coluna, downcast="integer")
+
+
+# Função para passar uma coluna float64 para float32 somente se nenhum valor mudar na conversão
+def reduzir_floats(coluna):
+    valores = coluna.to_numpy()
+    with np.errstate(over="ignore", invalid="ignore"):
+        convertidos = valores.astype("float32")
+    iguais = (convertidos.astype(valores.dtype) == valores) | (np.isnan(valores) & np.isnan(convertidos))
+    return pd.Series(convertidos, index=coluna.index, name=coluna.name) if iguais.all() else coluna
+
+
+# Função para converter texto repetitivo em categórica (códigos inteiros + uma cópia de cada valor distinto)
+def reduzir_texto(coluna, limite_cardinalidade=LIMITE_CARDINALIDADE):
+    if len(coluna) == 0:
+        return coluna
+    try:
+        distintos = coluna.nunique(dropna=True)
+    except TypeError:
+        # Valores não hasheáveis (listas, dicionários) não podem ser categorias
+        return coluna
+    if distintos > limite_cardinalidade * len(coluna):
+        return coluna
+    return coluna.astype("category")
+
+
+# Função para otimizar os tipos das colunas no carregamento, sem perder informação
+# As colunas monetárias continuam em float64; os tamanhos antes e depois ficam em dados.attrs["memoria_bytes"]
+def otimizar_tipos(dados, limite_cardinalidade=LIMITE_CARDINALIDADE):
+    antes = memoria_em_bytes(dados)
+    for coluna in dados.columns:
+        tipo = dados[coluna].dtype
+        if pd.api.types.is_bool_dtype(tipo) or isinstance(tipo, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_integer_dtype(tipo) and isinstance(tipo, np.dtype):
+            dados[coluna] = reduzir_inteiros(dados[coluna])
+        elif tipo == np.float64 and coluna not in COLUNAS_MONETARIAS:
+            dados[coluna] = reduzir_floats(dados[coluna])
+        elif tipo == object or pd.api.types.is_string_dtype(tipo):
+            dados[coluna] = reduzir_texto(dados[coluna], limite_cardinalidade)
+    dados.attrs["memoria_bytes"] = {"antes": antes, "depois": memoria_em_bytes(dados)}
+    return dados